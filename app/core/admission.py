@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from .r_runner import EngineCancelledError
+from .settings import settings
+
+# Umumiy xotirada ajratiladigan endpoint joylari soni
+MAX_ENDPOINTS = 8
+
+# Slot bo'shashini kutishda tekshirish oralig'i, soniya (slotni boshqa worker bo'shatishi mumkin)
+_POLL_INTERVAL = 0.02
+
+# Navbatda kutayotgan mijoz uzilganini tekshirish oralig'i, soniya
+_DISCONNECT_POLL = 0.5
+
+
+class AdmissionRejected(Exception):
+    """So'rov qabul qilinmadi: navbat to'la (429) yoki kutish muddati tugadi (503)."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+@dataclass
+class _EndpointState:
+    index: int
+    max_concurrent: int
+    max_queued: int
+
+
+class _SharedCounters:
+    """Worker jarayonlari orasida umumiy hisoblagichlar (fork'dan oldin ajratiladi).
+
+    Har bir worker faqat o'z qatoriga yozadi, jami qiymat — qatorlar yig'indisi. Qator:
+    ``[faol_jami, ep0_faol, ep0_kutayotgan, ep1_faol, ...]``. Worker yiqilsa, ota jarayon
+    uning qatorini nolga tushiradi va egallangan slotlar yo'qolib qolmaydi.
+    """
+
+    width = 1 + 2 * MAX_ENDPOINTS
+
+    def __init__(self, rows: int) -> None:
+        self.rows = rows
+        self.row = 0
+        self.values = multiprocessing.RawArray("i", rows * self.width)
+        self.lock = multiprocessing.Lock()
+
+    def total(self, col: int) -> int:
+        return sum(self.values[r * self.width + col] for r in range(self.rows))
+
+    def get(self, row: int, col: int) -> int:
+        return self.values[row * self.width + col]
+
+    def add(self, col: int, delta: int) -> None:
+        self.values[self.row * self.width + col] += delta
+
+    def reset_row(self, row: int) -> None:
+        with self.lock:
+            for col in range(self.width):
+                self.values[row * self.width + col] = 0
+
+
+def _active_col(state: _EndpointState) -> int:
+    return 1 + 2 * state.index
+
+
+def _waiting_col(state: _EndpointState) -> int:
+    return 2 + 2 * state.index
+
+
+class AdmissionController:
+    """Bir vaqtning o'zidagi model hisoblashlarini (global va endpoint bo'yicha) cheklaydi.
+
+    Har bir endpoint o'z navbatiga ega; navbat to'lsa 429, slot ``queue_timeout``
+    ichida bo'shamasa 503 qaytariladi (ikkalasida ham ``Retry-After``). Preforked serverda
+    ``share()`` fork'dan oldin chaqiriladi — cheklovlar barcha worker'lar uchun umumiy bo'ladi.
+    Endpoint'lar fork'dan oldin (modul yuklanganda) ``configure()`` qilinishi kerak.
+    """
+
+    def __init__(self, max_concurrent: int, queue_timeout: float, retry_after: int) -> None:
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._endpoints: Dict[str, _EndpointState] = {}
+        self._shared = _SharedCounters(rows=1)
+
+    def share(self, workers: int) -> None:
+        """Ota jarayonda, worker'larni fork qilishdan oldin: har bir worker uchun bitta qator."""
+        self._shared = _SharedCounters(rows=max(1, workers))
+
+    def bind_worker(self, slot: int) -> None:
+        self._shared.row = slot
+
+    def reset_worker(self, slot: int) -> None:
+        self._shared.reset_row(slot)
+
+    def configure(self, endpoint: str, max_concurrent: Optional[int] = None, max_queued: Optional[int] = None) -> None:
+        existing = self._endpoints.get(endpoint)
+        index = existing.index if existing is not None else len(self._endpoints)
+        if index >= MAX_ENDPOINTS:
+            raise ValueError(f"Endpoint'lar soni {MAX_ENDPOINTS} dan oshmasligi kerak")
+        self._endpoints[endpoint] = _EndpointState(
+            index=index,
+            max_concurrent=min(self.max_concurrent, max_concurrent or self.max_concurrent),
+            max_queued=settings.max_queued_per_endpoint if max_queued is None else max_queued,
+        )
+
+    def _state(self, endpoint: str) -> _EndpointState:
+        if endpoint not in self._endpoints:
+            self.configure(endpoint)
+        return self._endpoints[endpoint]
+
+    def max_slots(self, endpoint: str) -> int:
+        """Bitta so'rov bir vaqtda egallashi mumkin bo'lgan eng ko'p slot (global va endpoint chegarasi)."""
+        return min(self.max_concurrent, self._state(endpoint).max_concurrent)
+
+    def _can_run(self, state: _EndpointState, slots: int) -> bool:
+        shared = self._shared
+        return (
+            shared.total(0) + slots <= self.max_concurrent
+            and shared.total(_active_col(state)) + slots <= state.max_concurrent
+        )
+
+    def _take(self, state: _EndpointState, slots: int) -> None:
+        self._shared.add(0, slots)
+        self._shared.add(_active_col(state), slots)
+
+    def _release(self, state: _EndpointState, slots: int) -> None:
+        with self._shared.lock:
+            self._shared.add(0, -slots)
+            self._shared.add(_active_col(state), -slots)
+
+    def _others_waiting(self, state: _EndpointState) -> bool:
+        return any(
+            self._shared.total(_waiting_col(other)) > 0 for other in self._endpoints.values() if other is not state
+        )
+
+    def _enter(self, state: _EndpointState, slots: int, bounded: bool = True) -> bool:
+        """Slotlar bo'sh bo'lsa egallaydi (True), aks holda navbatga yoziladi (False) yoki 429.
+
+        ``bounded=False`` — fon ishi: boshqa endpoint'larda kutayotgan so'rov bo'lsa, slot unga qoldiriladi.
+        """
+        with self._shared.lock:
+            if self._can_run(state, slots) and (bounded or not self._others_waiting(state)):
+                self._take(state, slots)
+                return True
+            if bounded and self._shared.total(_waiting_col(state)) >= state.max_queued:
+                raise AdmissionRejected(429, "Server band: navbat to'la. Keyinroq urinib ko'ring.", self.retry_after)
+            self._shared.add(_waiting_col(state), 1)
+            return False
+
+    def _poll(self, state: _EndpointState, slots: int, background: bool = False) -> bool:
+        with self._shared.lock:
+            if not self._can_run(state, slots) or (background and self._others_waiting(state)):
+                return False
+            self._take(state, slots)
+            self._shared.add(_waiting_col(state), -1)
+            return True
+
+    def _leave_queue(self, state: _EndpointState) -> None:
+        with self._shared.lock:
+            self._shared.add(_waiting_col(state), -1)
+
+    def _give_up_at(self, deadline: Optional[float]) -> float:
+        timeout = self.queue_timeout
+        if deadline is not None:
+            timeout = min(timeout, max(0.0, deadline - time.monotonic()))
+        return time.monotonic() + timeout
+
+    def _queue_timeout_error(self) -> AdmissionRejected:
+        return AdmissionRejected(503, "Server band: hisoblash sloti bo'shamadi. Keyinroq urinib ko'ring.", self.retry_after)
+
+    @asynccontextmanager
+    async def admit(
+        self,
+        endpoint: str,
+        deadline: Optional[float] = None,
+        slots: int = 1,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    ) -> AsyncIterator[None]:
+        """``slots`` — so'rov ishga tushiradigan parallel R jarayonlari soni (``max_slots`` bilan cheklanadi).
+
+        ``is_disconnected`` berilsa, mijoz navbatda kutayotganda uzilganda so'rov navbatdan chiqadi
+        (``EngineCancelledError``) — tashlab ketilgan so'rovlar tirik mijozlarga 429 olib kelmasin.
+        """
+        state = self._state(endpoint)
+        slots = max(1, min(slots, self.max_slots(endpoint)))
+        if not self._enter(state, slots):
+            give_up = self._give_up_at(deadline)
+            check_at = time.monotonic() + _DISCONNECT_POLL
+            admitted = False
+            try:
+                while not admitted:
+                    now = time.monotonic()
+                    if now >= give_up:
+                        raise self._queue_timeout_error()
+                    if is_disconnected is not None and now >= check_at:
+                        check_at = now + _DISCONNECT_POLL
+                        if await is_disconnected():
+                            raise EngineCancelledError("Mijoz navbatda kutayotganda uzildi")
+                    await asyncio.sleep(_POLL_INTERVAL)
+                    admitted = self._poll(state, slots)
+            finally:
+                if not admitted:
+                    self._leave_queue(state)
+
+        try:
+            yield
+        finally:
+            self._release(state, slots)
+
+    @contextmanager
+    def hold(
+        self,
+        endpoint: str,
+        deadline: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+    ) -> Iterator[None]:
+        """Fon ishlari (oqimlar) uchun sinxron slot: ``deadline`` gacha kutadi, ``queue_timeout`` qo'llanmaydi.
+
+        Navbat uzunligi ishlar pool'lari bilan cheklangan, shuning uchun 429 qaytarilmaydi. Boshqa
+        endpoint'larda kutayotgan so'rovlar ustun: ular bor ekan, fon ishi yangi slot olmaydi.
+        """
+        state = self._state(endpoint)
+        if not self._enter(state, 1, bounded=False):
+            give_up = deadline if deadline is not None else time.monotonic() + self.queue_timeout
+            admitted = False
+            try:
+                while not admitted:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise EngineCancelledError("Ish slot kutayotganda bekor qilindi")
+                    if time.monotonic() >= give_up:
+                        raise self._queue_timeout_error()
+                    time.sleep(_POLL_INTERVAL)
+                    admitted = self._poll(state, 1, background=True)
+            finally:
+                if not admitted:
+                    self._leave_queue(state)
+
+        try:
+            yield
+        finally:
+            self._release(state, 1)
+
+    def snapshot(self) -> Dict[str, object]:
+        shared = self._shared
+        per_worker: List[Dict[str, int]] = [
+            {
+                "worker": row,
+                "active": shared.get(row, 0),
+                "queue_depth": sum(shared.get(row, _waiting_col(st)) for st in self._endpoints.values()),
+            }
+            for row in range(shared.rows)
+        ]
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": shared.total(0),
+            "queue_depth": sum(shared.total(_waiting_col(st)) for st in self._endpoints.values()),
+            "workers": per_worker,
+            "endpoints": {
+                name: {
+                    "max_concurrent": st.max_concurrent,
+                    "max_queued": st.max_queued,
+                    "active": shared.total(_active_col(st)),
+                    "waiting": shared.total(_waiting_col(st)),
+                }
+                for name, st in self._endpoints.items()
+            },
+        }
+
+
+admission = AdmissionController(
+    max_concurrent=settings.max_concurrent_fits,
+    queue_timeout=settings.queue_timeout,
+    retry_after=settings.retry_after,
+)
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import hashlib
 import re
+from dataclasses import dataclass
 from typing import Any, List, Optional, Sequence, Tuple
 
 # ---------- Normalization ----------
@@ -177,36 +179,135 @@ def infer_question_columns(rows: List[List[Any]], min_binary_ratio: float = 0.85
     return picked
 
 
-def clean_response_matrix(
-    matrix: List[List[Any]],
-    fill_missing: Optional[int] = None,
-) -> List[List[Optional[int]]]:
-    if not matrix:
-        return []
+# ---------- Sheet layout (detected once, reusable) ----------
+
+@dataclass(frozen=True)
+class SheetLayout:
+    question_columns: Tuple[int, ...]
+    label_columns: Tuple[int, ...] = ()
+    item_names: Tuple[str, ...] = ()
+    fingerprint: Optional[str] = None
+
+
+def _is_text_cell(value: Any) -> bool:
+    return isinstance(value, str) and value.strip() != "" and _normalize_cell(value) is None
+
+
+def header_fingerprint(rows: List[List[Any]]) -> Optional[str]:
+    """Header qatori bo'yicha barqaror kalit; header matnsiz bo'lsa None."""
+    if not rows:
+        return None
+    header = rows[0]
+    if not any(_is_text_cell(c) for c in header):
+        return None
+    col_count = max(len(r) for r in rows)
+    cells = ["" if c is None else str(c).strip().lower() for c in header]
+    cells += [""] * (col_count - len(cells))
+    digest = hashlib.sha1("\x1f".join(cells).encode("utf-8")).hexdigest()
+    return f"{col_count}:{digest}"
+
 
+def header_item_names(rows: List[List[Any]], qcols: Sequence[int]) -> Tuple[str, ...]:
+    if header_fingerprint(rows) is None:
+        return ()
+    header = rows[0]
+    return tuple(
+        str(header[j]).strip() if j < len(header) and _is_text_cell(header[j]) else f"Item{k}"
+        for k, j in enumerate(qcols, start=1)
+    )
+
+
+def _infer_label_columns(rows: List[List[Any]], qcols: Sequence[int]) -> List[int]:
+    max_len = max(len(r) for r in rows)
+    header = rows[0] + [None] * (max_len - len(rows[0]))
+    qset = set(qcols)
+    labels: List[int] = []
+    for j in range(max_len):
+        if j in qset:
+            continue
+        hv = header[j]
+        if isinstance(hv, str) and _looks_like_label_header(hv):
+            labels.append(j)
+            continue
+        body = [r[j] for r in rows[1:] if j < len(r) and str(r[j]).strip()]
+        if body and sum(1 for v in body if _is_text_cell(v)) * 2 >= len(body):
+            labels.append(j)
+    return labels
+
+
+def prepare_rows(matrix: List[List[Any]]) -> List[List[Any]]:
     # drop completely empty rows early
-    raw = [list(row) for row in matrix if any(str(c).strip() for c in row)]
-    if not raw:
-        return []
+    return [list(row) for row in matrix if any(str(c).strip() for c in row)]
+
 
-    # infer question columns
-    qcols = infer_question_columns(raw)
+def detect_layout(rows: List[List[Any]]) -> SheetLayout:
+    if not rows:
+        return SheetLayout(question_columns=())
+    qcols = infer_question_columns(rows)
+    return SheetLayout(
+        question_columns=tuple(qcols),
+        label_columns=tuple(_infer_label_columns(rows, qcols)),
+        item_names=header_item_names(rows, qcols),
+        fingerprint=header_fingerprint(rows),
+    )
+
+
+def apply_layout_indexed(
+    rows: List[List[Any]],
+    layout: SheetLayout,
+    fill_missing: Optional[int] = None,
+) -> Tuple[List[List[Optional[int]]], List[int]]:
+    """``apply_layout`` kabi, qo'shimcha ravishda saqlangan qatorlarning ``rows`` dagi indekslarini qaytaradi."""
+    qcols = list(layout.question_columns)
 
     # Normalize and select only question columns
     cleaned: List[List[Optional[int]]] = []
-    for row in raw:
+    kept: List[int] = []
+    for i, row in enumerate(rows):
         norm_row = [_normalize_cell(v) for v in row]
         # pad
         if len(norm_row) < (max(qcols) + 1 if qcols else 0):
             norm_row += [None] * ((max(qcols) + 1) - len(norm_row))
         selected = [norm_row[j] for j in qcols] if qcols else norm_row
+        # drop rows with no 0/1
+        if not any(v in (0, 1) for v in selected):
+            continue
         cleaned.append(selected)
-
-    # drop rows with no 0/1
-    cleaned = [r for r in cleaned if any(v in (0, 1) for v in r)]
+        kept.append(i)
 
     # optional fill
     if fill_missing in (0, 1):
         cleaned = [[(fill_missing if v is None else v) for v in r] for r in cleaned]
 
+    return cleaned, kept
+
+
+def apply_layout(
+    rows: List[List[Any]],
+    layout: SheetLayout,
+    fill_missing: Optional[int] = None,
+) -> List[List[Optional[int]]]:
+    cleaned, _ = apply_layout_indexed(rows, layout, fill_missing=fill_missing)
+    return cleaned
+
+
+def clean_with_layout(
+    matrix: List[List[Any]],
+    layout: Optional[SheetLayout] = None,
+    fill_missing: Optional[int] = None,
+) -> Tuple[List[List[Optional[int]]], SheetLayout]:
+    """Tozalash; ``layout`` berilsa ustunlarni aniqlash bosqichi o'tkazib yuboriladi."""
+    raw = prepare_rows(matrix) if matrix else []
+    if not raw:
+        return [], layout or SheetLayout(question_columns=())
+    if layout is None:
+        layout = detect_layout(raw)
+    return apply_layout(raw, layout, fill_missing=fill_missing), layout
+
+
+def clean_response_matrix(
+    matrix: List[List[Any]],
+    fill_missing: Optional[int] = None,
+) -> List[List[Optional[int]]]:
+    cleaned, _ = clean_with_layout(matrix, fill_missing=fill_missing)
     return cleaned
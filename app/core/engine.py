@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import json
+import math
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from .r_runner import run_rasch_model
+from .settings import settings
+
+_PROBE_EXPR = (
+    "suppressWarnings(suppressMessages({library(ltm); library(jsonlite)}));"
+    "cat(toJSON(list(r = R.version.string, ltm = as.character(packageVersion('ltm'))), auto_unbox = TRUE))"
+)
+
+
+@dataclass
+class EngineStatus:
+    available: bool
+    r_version: Optional[str] = None
+    ltm_version: Optional[str] = None
+    error: Optional[str] = None
+    checked_at: float = 0.0
+    warmed_up: bool = False
+    warmup_seconds: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+_status: Optional[EngineStatus] = None
+_lock = threading.Lock()
+
+
+def probe_engine(timeout: float = 30.0) -> EngineStatus:
+    """Rscript mavjudligini va ``ltm``/``jsonlite`` paketlari yuklanishini tekshiradi."""
+    global _status
+    now = time.time()
+    try:
+        proc = subprocess.run(
+            ["Rscript", "-e", _PROBE_EXPR],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+        if proc.returncode != 0:
+            status = EngineStatus(available=False, error=(proc.stderr or "").strip()[:500], checked_at=now)
+        else:
+            info = json.loads((proc.stdout or "").strip() or "{}")
+            status = EngineStatus(available=True, r_version=info.get("r"), ltm_version=info.get("ltm"), checked_at=now)
+    except FileNotFoundError:
+        status = EngineStatus(available=False, error="Rscript topilmadi", checked_at=now)
+    except subprocess.TimeoutExpired:
+        status = EngineStatus(available=False, error=f"Rscript {timeout:.0f} soniyada javob bermadi", checked_at=now)
+    except json.JSONDecodeError:
+        status = EngineStatus(available=False, error="Rscript tekshiruvi JSON qaytarmadi", checked_at=now)
+
+    with _lock:
+        if _status is not None and status.available:
+            status.warmed_up = _status.warmed_up
+            status.warmup_seconds = _status.warmup_seconds
+        _status = status
+    return status
+
+
+def engine_status(max_age: Optional[float] = None) -> EngineStatus:
+    max_age = settings.engine_probe_interval if max_age is None else max_age
+    with _lock:
+        current = _status
+    if current is None or time.time() - current.checked_at > max_age:
+        return probe_engine()
+    return current
+
+
+def _synthetic_matrix(n_persons: int, n_items: int, seed: int = 0) -> list[list[int]]:
+    rnd = random.Random(seed)
+    difficulties = [-2.0 + 4.0 * j / max(1, n_items - 1) for j in range(n_items)]
+    rows = []
+    for _ in range(n_persons):
+        theta = rnd.gauss(0.0, 1.0)
+        rows.append([int(rnd.random() < 1.0 / (1.0 + math.exp(-(theta - b)))) for b in difficulties])
+    return rows
+
+
+def warm_up_engine(n_persons: int = 200, n_items: int = 20, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Sintetik matritsada to'liq kalibrlash: R kutubxonalari va OS kesh sahifalari oldindan yuklanadi."""
+    if _status is None:
+        probe_engine()
+    started = time.monotonic()
+    with tempfile.TemporaryDirectory(prefix="rasch_warmup_") as tmpdir:
+        csv_path = Path(tmpdir) / "warmup.csv"
+        with csv_path.open("w", encoding="utf-8") as f:
+            for row in _synthetic_matrix(n_persons, n_items):
+                f.write(",".join(str(v) for v in row) + "\n")
+        result = run_rasch_model(csv_path, timeout=timeout or settings.engine_timeout)
+    elapsed = time.monotonic() - started
+
+    with _lock:
+        if _status is not None:
+            _status.warmed_up = True
+            _status.warmup_seconds = round(elapsed, 3)
+    return result
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .cleaning import SheetLayout, detect_layout, header_fingerprint, header_item_names
+from .settings import settings
+from .storage import file_lock, owner_key, read_json, write_json
+
+# Bitta foydalanuvchi/chat uchun saqlanadigan andozalar soni
+MAX_LAYOUTS_PER_OWNER = 20
+
+
+class LayoutStore:
+    """Foydalanuvchi (yoki bot chat) bo'yicha header fingerprint -> ustunlar andozasi.
+
+    Har bir egasi uchun alohida JSON fayl: yozish faqat shu egasining faylini qayta yozadi va
+    worker jarayonlari orasida fayl qulfi bilan himoyalanadi.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def _path(self, owner: str) -> Path:
+        return self.root / f"{owner_key(owner)}.json"
+
+    def _load(self, owner: str) -> Dict[str, Dict[str, Any]]:
+        data = read_json(self._path(owner))
+        return data if isinstance(data, dict) else {}
+
+    def get(self, owner: str, fingerprint: str) -> Optional[SheetLayout]:
+        entry = self._load(owner).get(fingerprint)
+        if not entry:
+            return None
+        return SheetLayout(
+            question_columns=tuple(entry.get("question_columns", ())),
+            label_columns=tuple(entry.get("label_columns", ())),
+            item_names=tuple(entry.get("item_names", ())),
+            fingerprint=fingerprint,
+        )
+
+    def put(self, owner: str, layout: SheetLayout) -> None:
+        if layout.fingerprint is None or not layout.question_columns:
+            return
+        entry = {
+            "question_columns": list(layout.question_columns),
+            "label_columns": list(layout.label_columns),
+            "item_names": list(layout.item_names),
+        }
+        current = self._load(owner).get(layout.fingerprint) or {}
+        if all(current.get(k) == v for k, v in entry.items()):
+            return  # O'zgarish yo'q — faylni qayta yozmaymiz
+
+        path = self._path(owner)
+        with file_lock(path):
+            layouts = self._load(owner)
+            layouts[layout.fingerprint] = {**entry, "updated_at": time.time()}
+            if len(layouts) > MAX_LAYOUTS_PER_OWNER:
+                oldest = sorted(layouts, key=lambda k: layouts[k].get("updated_at", 0))
+                for key in oldest[: len(layouts) - MAX_LAYOUTS_PER_OWNER]:
+                    del layouts[key]
+            write_json(path, layouts)
+
+
+layout_store = LayoutStore(settings.layout_store_path)
+
+
+def layout_from_spec(
+    rows: List[List[Any]],
+    question_columns: Sequence[int],
+    label_columns: Sequence[int] = (),
+    item_names: Optional[Sequence[str]] = None,
+) -> SheetLayout:
+    col_count = max((len(r) for r in rows), default=0)
+    for j in list(question_columns) + list(label_columns):
+        if j < 0 or j >= col_count:
+            raise ValueError(f"Ustun indeksi jadvaldan tashqarida: {j} (ustunlar soni {col_count})")
+    if item_names is not None and len(item_names) != len(question_columns):
+        raise ValueError("item_names soni question_columns soniga teng bo'lishi kerak")
+    return SheetLayout(
+        question_columns=tuple(question_columns),
+        label_columns=tuple(label_columns),
+        item_names=tuple(item_names) if item_names is not None else header_item_names(rows, question_columns),
+        fingerprint=header_fingerprint(rows),
+    )
+
+
+def resolve_layout(
+    rows: List[List[Any]],
+    owner: Optional[str] = None,
+    explicit: Optional[SheetLayout] = None,
+    store: Optional[LayoutStore] = None,
+) -> Tuple[SheetLayout, str]:
+    """Andozani tanlash: aniq berilgan > eslab qolingan > qayta aniqlangan.
+
+    Qaytaradi: (layout, manba) — manba ``explicit``, ``remembered`` yoki ``inferred``.
+    """
+    store = store or layout_store
+    if explicit is not None:
+        if owner:
+            store.put(owner, explicit)
+        return explicit, "explicit"
+
+    fingerprint = header_fingerprint(rows)
+    if owner and fingerprint is not None:
+        remembered = store.get(owner, fingerprint)
+        if remembered is not None:
+            return remembered, "remembered"
+
+    layout = detect_layout(rows)
+    if owner:
+        store.put(owner, layout)
+    return layout, "inferred"
+
+
+def apply_item_names(result: Dict[str, Any], item_names: Sequence[str]) -> Dict[str, Any]:
+    items = result.get("items")
+    if not item_names or not isinstance(items, list) or len(items) != len(item_names):
+        return result
+    renamed = [{**item, "item_id": name} for item, name in zip(items, item_names)]
+    return {**result, "items": renamed}
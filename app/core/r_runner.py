@@ -1,42 +1,94 @@
 from __future__ import annotations
 
 import json
+import os
+import signal
 import subprocess
+import threading
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional, Sequence
 
+# Bekor qilish (cancel) holatini tekshirish oralig'i, soniya
+_POLL_INTERVAL = 0.25
 
-def run_rasch_model(csv_path: Path) -> dict[str, Any]:
-    script_path = (Path(__file__).resolve().parents[1] / "r" / "rasch_calc.R").resolve()
 
+class EngineTimeoutError(RuntimeError):
+    """R jarayoni belgilangan muddatda tugamadi va to'xtatildi."""
+
+
+class EngineCancelledError(RuntimeError):
+    """So'rov bekor qilindi (masalan, mijoz uzildi) va R jarayoni to'xtatildi."""
+
+
+def _script_path(name: str) -> Path:
+    return (Path(__file__).resolve().parents[1] / "r" / name).resolve()
+
+
+def _kill_process(proc: subprocess.Popen) -> None:
+    # Rscript o'zi R jarayonini ishga tushiradi, shuning uchun butun guruhni o'ldiramiz
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+    try:
+        proc.communicate(timeout=5)
+    except Exception:
+        pass
+
+
+def _run_rscript(
+    script_name: str,
+    args: Sequence[str],
+    timeout: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> dict[str, Any]:
+    script_path = _script_path(script_name)
     if not script_path.exists():
         raise RuntimeError(f"R skript topilmadi: {script_path}")
-    if not csv_path.exists():
-        raise RuntimeError(f"CSV fayl topilmadi: {csv_path}")
 
-    cmd = [
-        "Rscript",
-        str(script_path),
-        str(csv_path),
-    ]
+    cmd = ["Rscript", str(script_path), *args]
 
     try:
-        proc = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            check=False,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
+            start_new_session=True,
         )
     except FileNotFoundError as e:
         raise RuntimeError(
             "Rscript topilmadi. Iltimos, R o'rnatilganligini va 'Rscript' tizim PATH ichida ekanligini tekshiring."
         ) from e
 
+    deadline = None if timeout is None else time.monotonic() + max(0.0, timeout)
+    while True:
+        wait_for: Optional[float] = None
+        if cancel_event is not None:
+            wait_for = _POLL_INTERVAL
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _kill_process(proc)
+                raise EngineTimeoutError(f"R hisoblash {timeout:.0f} soniyada tugamadi va to'xtatildi")
+            wait_for = remaining if wait_for is None else min(wait_for, remaining)
+        try:
+            stdout_text, stderr_text = proc.communicate(timeout=wait_for)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                _kill_process(proc)
+                raise EngineCancelledError("So'rov bekor qilindi, R hisoblash to'xtatildi")
+
     if proc.returncode != 0:
-        stderr_msg = (proc.stderr or "").strip()
+        stderr_msg = (stderr_text or "").strip()
         raise RuntimeError(f"R hisoblash xatosi. Kod: {proc.returncode}. Xabar: {stderr_msg}")
 
-    stdout_text = (proc.stdout or "").strip()
+    stdout_text = (stdout_text or "").strip()
     if not stdout_text:
         raise RuntimeError("R skript hech qanday natija chiqarmadi")
 
@@ -47,3 +99,41 @@ def run_rasch_model(csv_path: Path) -> dict[str, Any]:
         raise RuntimeError(f"R skript JSON formatida natija qaytarmadi. Boshi: {snippet}") from e
 
     return result
+
+
+def run_rasch_model(
+    csv_path: Path,
+    timeout: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> dict[str, Any]:
+    if not csv_path.exists():
+        raise RuntimeError(f"CSV fayl topilmadi: {csv_path}")
+    return _run_rscript("rasch_calc.R", [str(csv_path)], timeout=timeout, cancel_event=cancel_event)
+
+
+def run_bootstrap_chunk(
+    csv_path: Path,
+    first: int,
+    last: int,
+    seed: int,
+    timeout: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> dict[str, Any]:
+    if not csv_path.exists():
+        raise RuntimeError(f"CSV fayl topilmadi: {csv_path}")
+    args = [str(csv_path), str(first), str(last), str(seed)]
+    return _run_rscript("rasch_bootstrap.R", args, timeout=timeout, cancel_event=cancel_event)
+
+
+def run_dif_model(
+    csv_path: Path,
+    groups_path: Path,
+    cores: int = 1,
+    timeout: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+) -> dict[str, Any]:
+    for path in (csv_path, groups_path):
+        if not path.exists():
+            raise RuntimeError(f"Fayl topilmadi: {path}")
+    args = [str(csv_path), str(groups_path), str(max(1, cores))]
+    return _run_rscript("rasch_dif.R", args, timeout=timeout, cancel_event=cancel_event)
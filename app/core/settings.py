@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+_REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        return default
+
+
+def _cpu_count() -> int:
+    return os.cpu_count() or 1
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        return default
+
+
+@dataclass(frozen=True)
+class Settings:
+    # Engine (Rscript) deadlines, seconds
+    engine_timeout: float = 120.0
+    max_engine_timeout: float = 600.0
+
+    # Engine holatini qayta tekshirish oralig'i (readiness), soniya
+    engine_probe_interval: float = 60.0
+
+    # Admission control (standart: CPU soni va har bir endpoint navbati 4×CPU)
+    max_concurrent_fits: int = field(default_factory=_cpu_count)
+    max_queued_per_endpoint: int = field(default_factory=lambda: 4 * _cpu_count())
+    queue_timeout: float = 30.0
+    retry_after: int = 5
+
+    # Fon ishlari (bootstrap va h.k.)
+    max_jobs: int = 2
+    max_pending_jobs: int = 8
+    job_ttl: float = 3600.0
+    job_timeout: float = 3600.0
+    bootstrap_workers: int = field(default_factory=lambda: max(1, _cpu_count() // 2))
+    max_bootstrap_replicates: int = 2000
+
+    # DIF: bitta so'rov ichida guruhlarni parallel moslashtiruvchi R yadrolari
+    dif_cores: int = field(default_factory=lambda: min(4, _cpu_count()))
+
+    # Worker'lar uchun umumiy holat bazasi (fon ishlari, CAT banklari va sessiyalari)
+    state_db_path: Path = field(default=_REPO_ROOT / "var" / "state.sqlite3")
+
+    # CAT (adaptiv test) sessiyalari
+    cat_session_ttl: float = 1800.0
+    cat_max_sessions: int = 10000
+    cat_max_banks: int = 1000
+
+    # Eslab qolingan jadval andozalari (har bir egasi uchun alohida fayl)
+    layout_store_path: Path = field(default=_REPO_ROOT / "var" / "layouts")
+
+    # Saqlangan kalibrlashlar (qayta yuborilganda faqat o'zgargan qatorlarni hisoblash uchun)
+    calibration_store_path: Path = field(default=_REPO_ROOT / "var" / "calibrations")
+    calibration_ttl: float = 30 * 24 * 3600.0
+    # Muddati o'tgan kalibrlashlarni tozalash oralig'i, soniya
+    calibration_prune_interval: float = 3600.0
+    # Bot chatlari uchun kalibrlashlarni saqlash (matritsa va ismlar diskka yoziladi) — faqat yoqilganda
+    bot_remember_calibrations: bool = False
+
+
+def load_settings() -> Settings:
+    cpu = _cpu_count()
+    return Settings(
+        engine_timeout=_env_float("RASCH_ENGINE_TIMEOUT", 120.0),
+        max_engine_timeout=_env_float("RASCH_MAX_ENGINE_TIMEOUT", 600.0),
+        engine_probe_interval=_env_float("RASCH_ENGINE_PROBE_INTERVAL", 60.0),
+        max_concurrent_fits=max(1, _env_int("RASCH_MAX_CONCURRENT_FITS", cpu)),
+        max_queued_per_endpoint=max(0, _env_int("RASCH_MAX_QUEUED", 4 * cpu)),
+        queue_timeout=_env_float("RASCH_QUEUE_TIMEOUT", 30.0),
+        retry_after=max(1, _env_int("RASCH_RETRY_AFTER", 5)),
+        max_jobs=max(1, _env_int("RASCH_MAX_JOBS", 2)),
+        max_pending_jobs=max(0, _env_int("RASCH_MAX_PENDING_JOBS", 8)),
+        job_ttl=_env_float("RASCH_JOB_TTL", 3600.0),
+        job_timeout=_env_float("RASCH_JOB_TIMEOUT", 3600.0),
+        bootstrap_workers=max(1, _env_int("RASCH_BOOTSTRAP_WORKERS", max(1, cpu // 2))),
+        max_bootstrap_replicates=max(1, _env_int("RASCH_MAX_BOOTSTRAP_REPLICATES", 2000)),
+        dif_cores=max(1, _env_int("RASCH_DIF_CORES", min(4, cpu))),
+        state_db_path=Path(os.getenv("RASCH_STATE_DB", "").strip() or _REPO_ROOT / "var" / "state.sqlite3"),
+        cat_session_ttl=_env_float("RASCH_CAT_SESSION_TTL", 1800.0),
+        cat_max_sessions=max(1, _env_int("RASCH_CAT_MAX_SESSIONS", 10000)),
+        cat_max_banks=max(1, _env_int("RASCH_CAT_MAX_BANKS", 1000)),
+        layout_store_path=Path(os.getenv("RASCH_LAYOUT_STORE", "").strip() or _REPO_ROOT / "var" / "layouts"),
+        calibration_store_path=Path(
+            os.getenv("RASCH_CALIBRATION_STORE", "").strip() or _REPO_ROOT / "var" / "calibrations"
+        ),
+        calibration_ttl=_env_float("RASCH_CALIBRATION_TTL", 30 * 24 * 3600.0),
+        calibration_prune_interval=_env_float("RASCH_CALIBRATION_PRUNE_INTERVAL", 3600.0),
+        bot_remember_calibrations=os.getenv("RASCH_BOT_CALIBRATIONS", "").strip().lower() in {"1", "true", "yes"},
+    )
+
+
+settings = load_settings()
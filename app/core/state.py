@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+
+from .settings import settings
+
+
+class StateDB:
+    """Worker jarayonlari uchun umumiy holat bazasi (SQLite, WAL rejimi).
+
+    Fon ishlari va CAT sessiyalari shu yerda saqlanadi, shuning uchun preforked serverda so'rov
+    qaysi worker'ga tushishidan qat'i nazar bir xil holatni ko'radi. Har bir oqim (va fork'dan
+    keyingi har bir jarayon) o'z ulanishini ochadi.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._schemas: List[str] = []
+        self._local = threading.local()
+
+    def register_schema(self, ddl: str) -> None:
+        self._schemas.append(ddl)
+
+    def connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: tranzaksiyalar faqat aniq BEGIN bilan
+        conn = sqlite3.connect(str(self.path), timeout=30.0, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for ddl in self._schemas:
+            conn.executescript(ddl)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE: yozish qulfi darhol olinadi — o'qish-o'zgartirish-yozish atomik
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+state_db = StateDB(settings.state_db_path)
@@ -1,18 +1,40 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import os
+import secrets
 import tempfile
+import threading
+import time
+from dataclasses import replace
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Callable, List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse, Response
 from fastapi import Query
+from starlette.concurrency import run_in_threadpool
 
-from .schemas import CalculateRequest
-from .core.cleaning import clean_response_matrix
-from .core.r_runner import run_rasch_model
+from .schemas import (
+    CalculateRequest,
+    CatAnswerRequest,
+    CatBankRequest,
+    CatSessionRequest,
+    DifRequest,
+    SheetRequest,
+)
+from .core.admission import AdmissionRejected, admission
+from .core.cleaning import apply_layout_indexed, prepare_rows
+from .core.engine import engine_status
+from .core.layouts import apply_item_names, layout_from_spec, resolve_layout
+from .core.r_runner import EngineCancelledError, EngineTimeoutError, run_dif_model, run_rasch_model
+from .core.settings import settings
+from app.services.bootstrap import bootstrap_difficulties
+from app.services.calibrations import row_keys, run_incremental
+from app.services.cat import CatConfig, cat_service
+from app.services.dif import dif_contrasts
+from app.services.jobs import Job, job_manager
 from app.services.scoring import enrich_person_scores
 from app.services.pdf_generator import create_rasch_pdf_report
 
@@ -22,6 +44,15 @@ app = FastAPI(
     description="FastAPI backend that delegates Rasch model estimation to R (ltm::rasch) and returns JSON or PDF results.",
 )
 
+# Endpoint navbatlari fork'dan oldin ro'yxatdan o'tadi — preforked worker'larda umumiy hisoblagichlar bir xil joylashadi
+admission.configure("calculate")
+admission.configure("dif")
+# Bootstrap ishlari (to'liq moslashtirish va bo'laklar) ham umumiy slotlardan foydalanadi. max_concurrent_fits >= 2
+# bo'lsa kamida bitta slot interaktiv so'rovlar uchun bo'sh qoladi; bitta slotli serverda esa bootstrap bo'laklari
+# uni navbatma-navbat egallaydi va kutayotgan /calculate yoki /dif bo'lsa keyingi bo'lak slot olmaydi
+admission.configure("bootstrap", max_concurrent=min(settings.bootstrap_workers, max(1, settings.max_concurrent_fits - 1)))
+
+
 def _write_matrix_to_csv(temp_dir: Path, matrix: List[List[Optional[int]]]) -> Path:
     # No header; values separated by commas; missing represented as empty field
     csv_path = temp_dir / "responses.csv"
@@ -31,13 +62,80 @@ def _write_matrix_to_csv(temp_dir: Path, matrix: List[List[Optional[int]]]) -> P
             f.write(row_str + "\n")
     return csv_path
 
-@app.post("/calculate")
-def calculate(
-    request: CalculateRequest, 
-    format: str = Query(default="json", description="Output format: 'json' or 'pdf'")
-) -> Response:
-    # 1) Tozalash va heuristika asosida header/ustunlarni filtrlash
-    cleaned = clean_response_matrix(request.responses)
+# Mijoz uzilganini tekshirish oralig'i, soniya
+_DISCONNECT_POLL = 0.5
+
+# Mijoz so'rovni tashlab ketganda (nginx uslubidagi kod)
+_CLIENT_CLOSED_REQUEST = 499
+
+
+def _resolve_timeout(timeout: Optional[float]) -> float:
+    if timeout is None or timeout <= 0:
+        return settings.engine_timeout
+    return min(timeout, settings.max_engine_timeout)
+
+
+def _admission_error(e: AdmissionRejected) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+
+def _run_engine(
+    csv_path: Path,
+    deadline: float,
+    cancel: threading.Event,
+    runner: Callable[..., dict[str, Any]] = run_rasch_model,
+    *args: Any,
+) -> dict[str, Any]:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise HTTPException(status_code=504, detail="So'rov muddati navbatda kutish paytida tugadi.")
+    try:
+        return runner(csv_path, *args, timeout=remaining, cancel_event=cancel)
+    except EngineTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e)) from e
+    except EngineCancelledError as e:
+        raise HTTPException(status_code=_CLIENT_CLOSED_REQUEST, detail=str(e)) from e
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+async def _run_cancellable(http_request: Request, fn: Callable[..., Any], *args: Any) -> Any:
+    # Og'ir ishni threadpool'da bajaramiz; mijoz uzilsa cancel hodisasi R jarayonini o'ldiradi
+    cancel = threading.Event()
+    work = asyncio.ensure_future(run_in_threadpool(fn, *args, cancel))
+    try:
+        while True:
+            done, _ = await asyncio.wait({work}, timeout=_DISCONNECT_POLL)
+            if done:
+                return work.result()
+            if not cancel.is_set() and await http_request.is_disconnected():
+                cancel.set()
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+def _resolve_request_layout(request: SheetRequest, rows: List[List[Any]]):
+    owner = f"api:{request.client_id}" if request.client_id else None
+    explicit = None
+    if request.columns is not None:
+        try:
+            explicit = layout_from_spec(
+                rows,
+                request.columns.question_columns,
+                request.columns.label_columns,
+                request.columns.item_names,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e)) from e
+    return resolve_layout(rows, owner=owner, explicit=explicit)
+
+
+def _prepare_matrix(request: SheetRequest):
+    # 1) Tozalash: aniq berilgan yoki eslab qolingan andoza, bo'lmasa heuristika
+    rows = prepare_rows(request.responses)
+    layout, layout_source = _resolve_request_layout(request, rows)
+    cleaned, kept = apply_layout_indexed(rows, layout)
     if not cleaned:
         raise HTTPException(status_code=400, detail="Tozalashdan so'ng matritsa bo'sh qoldi.")
 
@@ -48,19 +146,23 @@ def calculate(
     for idx, row in enumerate(cleaned, start=1):
         if len(row) != num_items:
             raise HTTPException(status_code=400, detail=f"{idx}-qator uzunligi mos emas: {len(row)} != {num_items}")
+    return cleaned, layout, layout_source, rows, kept
 
-    with tempfile.TemporaryDirectory(prefix="rasch_") as tmpdir:
-        tmp_path = Path(tmpdir)
-        csv_path = _write_matrix_to_csv(tmp_path, cleaned)
 
-        try:
-            result: dict[str, Any] = run_rasch_model(csv_path)
-            result = enrich_person_scores(result)
-        except RuntimeError as e:
-            raise HTTPException(status_code=500, detail=str(e)) from e
+def _finalize_result(result: dict[str, Any], layout, layout_source: str) -> dict[str, Any]:
+    result = enrich_person_scores(result)
+    result = apply_item_names(result, layout.item_names)
+    result["layout"] = {
+        "source": layout_source,
+        "question_columns": list(layout.question_columns),
+        "label_columns": list(layout.label_columns),
+    }
+    return result
+
 
+def _render_result(result: dict[str, Any], output_format: str) -> Response:
     # Format bo'yicha javob qaytarish
-    if format.lower() == "pdf":
+    if output_format.lower() == "pdf":
         try:
             pdf_content = create_rasch_pdf_report(result)
             return Response(
@@ -73,10 +175,361 @@ def calculate(
     else:
         return JSONResponse(content=result)
 
+
+def _calculate_sync(
+    request: CalculateRequest,
+    output_format: str,
+    deadline: float,
+    cancel: threading.Event,
+) -> Response:
+    cleaned, layout, layout_source, rows, kept = _prepare_matrix(request)
+
+    def run_full() -> dict[str, Any]:
+        with tempfile.TemporaryDirectory(prefix="rasch_") as tmpdir:
+            tmp_path = Path(tmpdir)
+            csv_path = _write_matrix_to_csv(tmp_path, cleaned)
+            return _run_engine(csv_path, deadline, cancel)
+
+    changelog = None
+    if request.client_id and (request.sheet_id or request.remember_calibration):
+        # Kalibrlashni saqlash ixtiyoriy (sheet_id yoki remember_calibration bilan): qayta yuborishda faqat
+        # o'zgargan qatorlar hisoblanadi. sheet_id bo'lmasa avvalgi jadval header va qator fingerprint'lari bo'yicha topiladi
+        keys = row_keys(rows, kept, layout, cleaned)
+        result, changelog = run_incremental(
+            cleaned,
+            keys,
+            owner=f"api:{request.client_id}",
+            fingerprint=layout.fingerprint,
+            run_full=run_full,
+            sheet_id=request.sheet_id,
+            tolerance=request.refit_tolerance,
+        )
+    else:
+        result = run_full()
+    result = _finalize_result(result, layout, layout_source)
+    if changelog is not None:
+        result["changelog"] = changelog
+    return _render_result(result, output_format)
+
+
+def _bootstrap_job(cleaned, layout, layout_source: str, replicates: int, seed: int, ci_level: float):
+    def run(job: Job) -> dict[str, Any]:
+        deadline = time.monotonic() + settings.job_timeout
+        with tempfile.TemporaryDirectory(prefix="rasch_boot_") as tmpdir:
+            csv_path = _write_matrix_to_csv(Path(tmpdir), cleaned)
+
+            job.report(0, replicates, stage="fit")
+            with admission.hold("bootstrap", deadline=deadline, cancel_event=job.cancel_event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise EngineTimeoutError("Ish muddati slot kutish paytida tugadi")
+                result = run_rasch_model(csv_path, timeout=remaining, cancel_event=job.cancel_event)
+            result = _finalize_result(result, layout, layout_source)
+
+            job.report(0, replicates, stage="bootstrap")
+            boot = bootstrap_difficulties(
+                csv_path,
+                n_items=len(cleaned[0]),
+                replicates=replicates,
+                seed=seed,
+                ci_level=ci_level,
+                deadline=deadline,
+                cancel_event=job.cancel_event,
+                progress=lambda done, total: job.report(done, total),
+            )
+
+        boot_items = boot.pop("items")
+        items = result.get("items") or []
+        if len(items) == len(boot_items):
+            result["items"] = [{**item, **extra} for item, extra in zip(items, boot_items)]
+        result["bootstrap"] = boot
+        return result
+
+    return run
+
+
+def _job_url(job: Job) -> str:
+    return f"/jobs/{job.job_id}"
+
+
+@app.post("/calculate")
+async def calculate(
+    request: CalculateRequest,
+    http_request: Request,
+    format: str = Query(default="json", description="Output format: 'json' or 'pdf'"),
+    timeout: Optional[float] = Query(
+        default=None, description="Deadline in seconds (queueing + estimation), capped by the server maximum"
+    ),
+    se: Optional[str] = Query(
+        default=None, description="Item difficulty standard errors: 'bootstrap' runs as a background job"
+    ),
+    replicates: int = Query(default=200, ge=2, description="Number of bootstrap replicates"),
+    seed: Optional[int] = Query(default=None, ge=0, le=2**30, description="Bootstrap seed (random if omitted)"),
+    ci_level: float = Query(default=0.95, gt=0, lt=1, description="Percentile interval level"),
+) -> Response:
+    if se is not None:
+        if se.lower() != "bootstrap":
+            raise HTTPException(status_code=400, detail=f"Noma'lum se rejimi: {se}. Faqat 'bootstrap' qo'llab-quvvatlanadi.")
+        if replicates > settings.max_bootstrap_replicates:
+            raise HTTPException(
+                status_code=400,
+                detail=f"replicates {settings.max_bootstrap_replicates} dan oshmasligi kerak",
+            )
+        cleaned, layout, layout_source, _, _ = await run_in_threadpool(_prepare_matrix, request)
+        boot_seed = seed if seed is not None else secrets.randbelow(2**30)
+        try:
+            job = job_manager.submit(
+                "bootstrap", _bootstrap_job(cleaned, layout, layout_source, replicates, boot_seed, ci_level)
+            )
+        except AdmissionRejected as e:
+            raise _admission_error(e) from e
+        return JSONResponse(
+            status_code=202,
+            content={**job.to_dict(include_result=False), "status_url": _job_url(job)},
+            headers={"Location": _job_url(job)},
+        )
+
+    deadline = time.monotonic() + _resolve_timeout(timeout)
+    try:
+        async with admission.admit("calculate", deadline=deadline, is_disconnected=http_request.is_disconnected):
+            return await _run_cancellable(http_request, _calculate_sync, request, format, deadline)
+    except AdmissionRejected as e:
+        raise _admission_error(e) from e
+    except EngineCancelledError as e:
+        raise HTTPException(status_code=_CLIENT_CLOSED_REQUEST, detail=str(e)) from e
+
+def _resolve_group_column(rows: List[List[Any]], column: Any) -> int:
+    col_count = max((len(r) for r in rows), default=0)
+    if isinstance(column, int):
+        if not 0 <= column < col_count:
+            raise HTTPException(status_code=400, detail=f"Guruh ustuni jadvaldan tashqarida: {column}")
+        return column
+    name = str(column).strip().lower()
+    header = rows[0] if rows else []
+    for j, cell in enumerate(header):
+        if isinstance(cell, str) and cell.strip().lower() == name:
+            return j
+    raise HTTPException(status_code=400, detail=f"Guruh ustuni header'da topilmadi: {column}")
+
+
+def _dif_sync(request: DifRequest, deadline: float, cores: int, cancel: threading.Event) -> Response:
+    rows = prepare_rows(request.responses)
+    if not rows:
+        raise HTTPException(status_code=400, detail="Tozalashdan so'ng matritsa bo'sh qoldi.")
+    group_col = _resolve_group_column(rows, request.group_column)
+    layout, layout_source = _resolve_request_layout(request, rows)
+
+    # Ikkilik guruh ustuni (masalan, jins 0/1) savol deb aniqlangan bo'lishi mumkin — chiqarib tashlaymiz
+    if group_col in layout.question_columns:
+        keep = [k for k, j in enumerate(layout.question_columns) if j != group_col]
+        layout = replace(
+            layout,
+            question_columns=tuple(layout.question_columns[k] for k in keep),
+            item_names=tuple(layout.item_names[k] for k in keep) if layout.item_names else (),
+        )
+    if not layout.question_columns:
+        raise HTTPException(status_code=400, detail="Hech qanday item ustuni aniqlanmadi.")
+
+    cleaned, kept = apply_layout_indexed(rows, layout)
+    labels = [
+        str(rows[i][group_col]).strip().replace("\n", " ") if group_col < len(rows[i]) and rows[i][group_col] is not None else ""
+        for i in kept
+    ]
+    sizes: dict[str, int] = {}
+    for label in labels:
+        if label:
+            sizes[label] = sizes.get(label, 0) + 1
+    excluded = {g: n for g, n in sizes.items() if n < request.min_group_size}
+    labels = ["" if label in excluded else label for label in labels]
+    if len(sizes) - len(excluded) < 2:
+        raise HTTPException(
+            status_code=400,
+            detail=f"DIF uchun kamida 2 ta guruh (har biri >= {request.min_group_size} kishi) kerak.",
+        )
+    if request.reference_group is not None and request.reference_group not in sizes:
+        raise HTTPException(status_code=400, detail=f"Referens guruh topilmadi: {request.reference_group}")
+
+    item_ids = list(layout.item_names) or [f"Item{k}" for k in range(1, len(layout.question_columns) + 1)]
+    with tempfile.TemporaryDirectory(prefix="rasch_dif_") as tmpdir:
+        tmp_path = Path(tmpdir)
+        csv_path = _write_matrix_to_csv(tmp_path, cleaned)
+        groups_path = tmp_path / "groups.txt"
+        groups_path.write_text("\n".join(labels) + "\n", encoding="utf-8")
+        engine_result = _run_engine(csv_path, deadline, cancel, run_dif_model, groups_path, cores)
+
+    try:
+        dif = dif_contrasts(engine_result, item_ids, request.reference_group, alpha=request.alpha)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+
+    def _items(block: dict[str, Any]) -> List[dict[str, Any]]:
+        diffs = block.get("difficulty") or [None] * len(item_ids)
+        ses = block.get("se") or [None] * len(item_ids)
+        return [{"item_id": i, "difficulty": b, "se": e} for i, b, e in zip(item_ids, diffs, ses)]
+
+    pooled = engine_result.get("pooled") or {}
+    result = {
+        "group_column": group_col,
+        "reference_group": dif["reference_group"],
+        "pooled": {
+            "n_persons": pooled.get("n_persons"),
+            "discrimination": pooled.get("discrimination"),
+            "items": _items(pooled),
+            "fit": pooled.get("fit"),
+        },
+        "groups": [
+            {
+                "group": g.get("group"),
+                "n_persons": g.get("n_persons"),
+                "discrimination": g.get("discrimination"),
+                "items": _items(g),
+                "fit": g.get("fit"),
+                "error": g.get("error"),
+            }
+            for g in engine_result.get("groups") or []
+        ],
+        "excluded_groups": [{"group": g, "n_persons": n} for g, n in excluded.items()],
+        "dif": dif,
+        "layout": {
+            "source": layout_source,
+            "question_columns": list(layout.question_columns),
+            "label_columns": list(layout.label_columns),
+        },
+    }
+    return JSONResponse(content=result)
+
+
+@app.post("/dif")
+async def dif_analysis(
+    request: DifRequest,
+    http_request: Request,
+    timeout: Optional[float] = Query(
+        default=None, description="Deadline in seconds (queueing + estimation), capped by the server maximum"
+    ),
+) -> Response:
+    deadline = time.monotonic() + _resolve_timeout(timeout)
+    # Har bir parallel guruh moslashtirishi alohida R jarayoni — har biri umumiy chegaradan bitta slot oladi
+    cores = min(settings.dif_cores, admission.max_slots("dif"))
+    try:
+        async with admission.admit(
+            "dif", deadline=deadline, slots=cores, is_disconnected=http_request.is_disconnected
+        ):
+            return await _run_cancellable(http_request, _dif_sync, request, deadline, cores)
+    except AdmissionRejected as e:
+        raise _admission_error(e) from e
+    except EngineCancelledError as e:
+        raise HTTPException(status_code=_CLIENT_CLOSED_REQUEST, detail=str(e)) from e
+
+
+def _register_cat_bank(items: List[Any], inline: bool = False) -> str:
+    try:
+        bank_id, _ = cat_service.register_bank([it.model_dump() for it in items], inline=inline)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except OverflowError as e:
+        raise HTTPException(
+            status_code=429, detail="Item banklari soni chegarasiga yetdi.", headers={"Retry-After": str(settings.retry_after)}
+        ) from e
+    return bank_id
+
+
+@app.post("/cat/banks")
+def create_cat_bank(request: CatBankRequest) -> Response:
+    bank_id = _register_cat_bank(request.items)
+    return JSONResponse(status_code=201, content={"bank_id": bank_id, "n_items": len(request.items)})
+
+
+@app.post("/cat/sessions")
+def start_cat_session(request: CatSessionRequest) -> Response:
+    if (request.bank_id is None) == (request.items is None):
+        raise HTTPException(status_code=400, detail="bank_id yoki items dan faqat bittasini bering.")
+    bank_id = request.bank_id if request.bank_id is not None else _register_cat_bank(request.items or [], inline=True)
+    config = CatConfig(se_target=request.se_target, max_items=request.max_items, min_items=request.min_items)
+    try:
+        session = cat_service.start(bank_id, config, start_theta=request.start_theta)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail="Item banki topilmadi yoki muddati o'tgan.") from e
+    except OverflowError as e:
+        raise HTTPException(
+            status_code=429, detail="Faol sessiyalar soni chegarasiga yetdi.", headers={"Retry-After": str(settings.retry_after)}
+        ) from e
+    return JSONResponse(status_code=201, content=session.to_dict())
+
+
+def _get_cat_session(session_id: str):
+    session = cat_service.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sessiya topilmadi yoki muddati o'tgan.")
+    return session
+
+
+@app.post("/cat/sessions/{session_id}/answers")
+def answer_cat_item(session_id: str, request: CatAnswerRequest) -> Response:
+    try:
+        session = cat_service.answer(session_id, request.item_id, request.response)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sessiya topilmadi yoki muddati o'tgan.")
+    return JSONResponse(content=session.to_dict())
+
+
+@app.get("/cat/sessions/{session_id}")
+def get_cat_session(session_id: str) -> Response:
+    return JSONResponse(content=_get_cat_session(session_id).to_dict())
+
+
+@app.delete("/cat/sessions/{session_id}")
+def end_cat_session(session_id: str) -> Response:
+    session = cat_service.end(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sessiya topilmadi yoki muddati o'tgan.")
+    return JSONResponse(content=session.to_dict())
+
+
+@app.get("/jobs/{job_id}")
+def get_job(
+    job_id: str,
+    format: str = Query(default="json", description="Output format for a finished job: 'json' or 'pdf'"),
+) -> Response:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ish topilmadi yoki muddati o'tgan.")
+    if format.lower() == "pdf":
+        if job.status != "done" or job.result is None:
+            raise HTTPException(status_code=409, detail=f"Ish hali tayyor emas: {job.status}")
+        return _render_result(job.result, "pdf")
+    return JSONResponse(content=job.to_dict())
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str) -> Response:
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ish topilmadi yoki muddati o'tgan.")
+    return JSONResponse(content=job.to_dict(include_result=False))
+
+
 @app.get("/")
 def read_root():
     return {"message": "Rasch Model Calculator API", "version": "1.0.0"}
 
 @app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+def health_check() -> Response:
+    # Readiness: engine mavjud bo'lmasa 503 — load balancer trafikni bu worker'ga yubormaydi
+    engine = engine_status()
+    body = {
+        "status": "healthy" if engine.available else "unavailable",
+        "ready": engine.available,
+        "pid": os.getpid(),
+        "engine": engine.to_dict(),
+        "admission": admission.snapshot(),
+        "jobs": job_manager.snapshot(),
+        "pools": {
+            "max_concurrent_fits": settings.max_concurrent_fits,
+            "bootstrap_workers": settings.bootstrap_workers,
+            "dif_cores": settings.dif_cores,
+        },
+        "cat_sessions": cat_service.session_count(),
+    }
+    return JSONResponse(status_code=200 if engine.available else 503, content=body)
@@ -1,17 +1,41 @@
 from __future__ import annotations
 
-from typing import Any, List
+from typing import Any, List, Optional, Union
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 
-class CalculateRequest(BaseModel):
+class ColumnSpec(BaseModel):
+    question_columns: List[int] = Field(..., description="0-based indices of item (question) columns")
+    label_columns: List[int] = Field(default_factory=list, description="0-based indices of person label columns")
+    item_names: Optional[List[str]] = Field(default=None, description="Item names, one per question column")
+
+    @field_validator("question_columns")
+    @classmethod
+    def validate_question_columns(cls, value):
+        if not value:
+            raise ValueError("Kamida bitta savol ustuni ko'rsatilishi kerak")
+        if any(j < 0 for j in value):
+            raise ValueError("Ustun indekslari manfiy bo'lmasligi kerak")
+        if len(set(value)) != len(value):
+            raise ValueError("Savol ustunlari takrorlanmasligi kerak")
+        return value
+
+
+# /calculate va /dif uchun umumiy maydonlar: jadval, mijoz va ustunlar andozasi
+class SheetRequest(BaseModel):
     responses: List[List[Any]] = Field(
         ..., description=(
             "Binary response matrix (rows=persons, cols=items). May contain headers/labels; "
             "values could be 0/1/None/strings; they will be cleaned server-side."
         )
     )
+    client_id: Optional[str] = Field(
+        default=None, description="Stable client/user id; detected sheet layouts are remembered per client"
+    )
+    columns: Optional[ColumnSpec] = Field(
+        default=None, description="Explicit column layout; overrides (and replaces) the remembered one"
+    )
 
     @field_validator("responses")
     @classmethod
@@ -21,3 +45,78 @@ class CalculateRequest(BaseModel):
         if not all(isinstance(row, list) for row in value):
             raise ValueError("Har bir qator ro'yxat bo'lishi kerak")
         return value
+
+
+class CalculateRequest(SheetRequest):
+    sheet_id: Optional[str] = Field(
+        default=None, max_length=200,
+        description=(
+            "Stable sheet id (requires client_id); opts in to storing the calibration so that "
+            "a resubmission re-scores only changed rows"
+        ),
+    )
+    remember_calibration: bool = Field(
+        default=False,
+        description=(
+            "Store the calibration without a sheet_id (requires client_id); a resubmission of the same "
+            "header with mostly the same rows is recognised by row fingerprints"
+        ),
+    )
+    refit_tolerance: float = Field(
+        default=0.5, ge=0, le=10,
+        description=(
+            "Refit the model only if some item's proportion correct moved more than this many standard "
+            "errors, sqrt(p(1-p)/N), since the last fit"
+        ),
+    )
+
+    @model_validator(mode="after")
+    def validate_sheet_owner(self):
+        # Kalibrlash egasi bo'yicha saqlanadi — egasiz sheet_id boshqa mijozning jadvaliga tushib qolmasin
+        if self.sheet_id is not None and not self.client_id:
+            raise ValueError("sheet_id faqat client_id bilan birga berilishi mumkin")
+        if self.remember_calibration and not self.client_id:
+            raise ValueError("remember_calibration faqat client_id bilan birga berilishi mumkin")
+        return self
+
+
+class DifRequest(SheetRequest):
+    group_column: Union[int, str] = Field(
+        ..., description="Grouping column: 0-based index or header name (e.g. region, gender, language)"
+    )
+    reference_group: Optional[str] = Field(
+        default=None, description="Reference group label; defaults to the largest group"
+    )
+    min_group_size: int = Field(default=10, ge=2, description="Groups with fewer persons are excluded")
+    alpha: float = Field(default=0.05, gt=0, lt=1, description="Significance level (Holm-adjusted)")
+
+
+class CatItem(BaseModel):
+    item_id: str
+    difficulty: float
+    discrimination: Optional[float] = Field(default=None, gt=0, description="Common ltm discrimination; 1.0 if omitted")
+
+
+class CatBankRequest(BaseModel):
+    items: List[CatItem] = Field(..., description="Calibrated items, e.g. the 'items' block returned by /calculate")
+
+    @field_validator("items")
+    @classmethod
+    def validate_items(cls, value):
+        if not value:
+            raise ValueError("Item banki bo'sh bo'lmasligi kerak")
+        return value
+
+
+class CatSessionRequest(BaseModel):
+    bank_id: Optional[str] = Field(default=None, description="Id returned by POST /cat/banks")
+    items: Optional[List[CatItem]] = Field(default=None, description="Inline item bank (registered on the fly)")
+    se_target: float = Field(default=0.3, gt=0, description="Stop when posterior SD falls below this value")
+    max_items: int = Field(default=20, ge=1, description="Stop after this many answers")
+    min_items: int = Field(default=3, ge=0, description="Never stop on SE before this many answers")
+    start_theta: float = Field(default=0.0, description="Ability used to pick the first item")
+
+
+class CatAnswerRequest(BaseModel):
+    item_id: str
+    response: int = Field(..., ge=0, le=1)
@@ -0,0 +1,168 @@
+"""Production ishga tushirish: ilova va engine ota jarayonda oldindan yuklanadi, so'ng
+worker'lar fork qilinadi va xotira sahifalarini copy-on-write tarzida bo'lishadi.
+
+    python -m app.server --host 0.0.0.0 --port 8000 --workers 4 --warmup
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, List, Tuple
+
+import uvicorn
+
+# Worker ketma-ket tez-tez yiqilsa, qayta ishga tushirishdan oldin kutish, soniya
+_RESPAWN_BACKOFF = 1.0
+
+
+def _parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Rasch API — preforked multi-worker server")
+    parser.add_argument("--host", default=os.getenv("RASCH_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("RASCH_PORT", "8000")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("RASCH_WORKERS", str(os.cpu_count() or 1))),
+        help="Worker jarayonlari soni",
+    )
+    parser.add_argument(
+        "--warmup", action="store_true", default=os.getenv("RASCH_WARMUP", "").strip() in {"1", "true", "yes"},
+        help="Trafikni qabul qilishdan oldin sintetik matritsada kalibrlash",
+    )
+    parser.add_argument("--log-level", default=os.getenv("RASCH_LOG_LEVEL", "info"))
+    return parser.parse_args(argv)
+
+
+def _preload(warmup: bool) -> None:
+    # FastAPI, reportlab, matplotlib va boshqa og'ir importlar ota jarayonda bir marta
+    from app.main import app  # noqa: F401
+    from app.core.engine import probe_engine, warm_up_engine
+    from app.services.pdf_generator import create_rasch_pdf_report
+    from app.services.scoring import enrich_person_scores
+
+    status = probe_engine()
+    if not status.available:
+        print(f"⚠️ R engine mavjud emas: {status.error}", file=sys.stderr)
+        return
+    print(f"✅ R engine: {status.r_version}, ltm {status.ltm_version}")
+    if warmup:
+        try:
+            result = warm_up_engine()
+            # PDF ham bir marta chiziladi: shriftlar keshi va matplotlib backend'i yuklanadi
+            create_rasch_pdf_report(enrich_person_scores(result))
+            print("🔥 Warm-up kalibrlash bajarildi")
+        except Exception as e:
+            print(f"⚠️ Warm-up xatosi: {e}", file=sys.stderr)
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, log_level: str, slot: int) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    from app.core.admission import admission
+    from app.main import app
+
+    admission.bind_worker(slot)
+
+    config = uvicorn.Config(app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def _spawn(sock: socket.socket, log_level: str, slot: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(sock, log_level, slot)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except BaseException:
+            # os._exit buferlarni tozalamaydi — sabab logda qolishi uchun traceback darhol chiqariladi
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+    return pid
+
+
+def main(argv: List[str] | None = None) -> None:
+    if not hasattr(os, "fork"):
+        raise SystemExit("Preforked rejim faqat POSIX tizimlarida ishlaydi; 'uvicorn app.main:app' dan foydalaning.")
+
+    args = _parse_args(sys.argv[1:] if argv is None else argv)
+    _preload(args.warmup)
+    n_workers = max(1, args.workers)
+
+    from app.core.admission import admission
+    from app.services.jobs import job_manager
+
+    # Hisoblash slotlari hisoblagichlari umumiy xotirada — cheklovlar barcha worker'lar uchun bitta
+    admission.share(n_workers)
+
+    # Import qilingan obyektlarni GC kuzatuvidan chiqaramiz — fork'dan keyin sahifalar nusxalanmaydi
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind_socket(args.host, args.port)
+    workers: Dict[int, Tuple[int, float]] = {}
+    for slot in range(n_workers):
+        workers[_spawn(sock, args.log_level, slot)] = (slot, time.monotonic())
+    print(f"🚀 {len(workers)} ta worker http://{args.host}:{args.port} da ishlamoqda")
+
+    stopping = False
+
+    def _stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        entry = workers.pop(pid, None)
+        if entry is None:
+            continue
+        slot, started = entry
+        # Yiqilgan worker egallagan slotlar bo'shatiladi, uning fon ishlari "failed" deb belgilanadi
+        admission.reset_worker(slot)
+        job_manager.fail_orphaned(pid)
+        if stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        print(f"⚠️ Worker {pid} to'xtadi (kod {code}), qayta ishga tushirilmoqda", file=sys.stderr)
+        if time.monotonic() - started < _RESPAWN_BACKOFF:
+            time.sleep(_RESPAWN_BACKOFF)
+        workers[_spawn(sock, args.log_level, slot)] = (slot, time.monotonic())
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.admission import admission
+from app.core.r_runner import EngineCancelledError, EngineTimeoutError, run_bootstrap_chunk
+from app.core.settings import settings
+
+# Bitta Rscript chaqiruvidagi replikatsiyalar soni (R ishga tushish xarajatini taqsimlash uchun)
+CHUNK_SIZE = 25
+
+# Barcha bootstrap ishlari uchun umumiy pool: bir vaqtda ishlaydigan R jarayonlari soni cheklangan
+_chunk_pool = ThreadPoolExecutor(max_workers=settings.bootstrap_workers, thread_name_prefix="rasch-boot")
+
+
+def _chunks(replicates: int, workers: int) -> List[tuple[int, int]]:
+    size = max(1, min(CHUNK_SIZE, math.ceil(replicates / max(1, workers))))
+    return [(start, min(start + size - 1, replicates)) for start in range(1, replicates + 1, size)]
+
+
+def bootstrap_difficulties(
+    csv_path: Path,
+    n_items: int,
+    replicates: int,
+    seed: int,
+    ci_level: float = 0.95,
+    deadline: Optional[float] = None,
+    cancel_event: Optional[threading.Event] = None,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """Item qiyinchiliklari uchun bootstrap SE va percentil intervallar.
+
+    Replikatsiyalar bo'laklarga ajratilib, umumiy pool orqali parallel R jarayonlarida hisoblanadi.
+    Har bir replikatsiya ``seed + indeks`` bilan boshlanadi, shuning uchun natija takrorlanadi.
+    """
+    chunks = _chunks(replicates, settings.bootstrap_workers)
+    draws: Dict[int, List[Optional[float]]] = {}
+    failed = 0
+    done_reps = 0
+
+    def _run_chunk(first: int, last: int) -> Dict[str, Any]:
+        if cancel_event is not None and cancel_event.is_set():
+            raise EngineCancelledError("Bootstrap bekor qilindi")
+        # Har bir R jarayoni umumiy hisoblash slotini egallaydi (oddiy so'rovlar bilan bir cheklov ostida)
+        with admission.hold("bootstrap", deadline=deadline, cancel_event=cancel_event):
+            # Muddat slot olingandan keyin, R ishga tushishidan oldin hisoblanadi
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                raise EngineTimeoutError("Bootstrap muddati tugadi")
+            return run_bootstrap_chunk(csv_path, first, last, seed, timeout=timeout, cancel_event=cancel_event)
+
+    futures = {_chunk_pool.submit(_run_chunk, first, last): (first, last) for first, last in chunks}
+    try:
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                first, last = futures[fut]
+                out = fut.result()
+                for idx, values in zip(out.get("indices") or [], out.get("difficulties") or []):
+                    draws[int(idx)] = values
+                failed += int(out.get("failed") or 0)
+                done_reps += last - first + 1
+                if progress is not None:
+                    progress(done_reps, replicates)
+    except BaseException:
+        if cancel_event is not None:
+            cancel_event.set()
+        for fut in futures:
+            fut.cancel()
+        raise
+
+    alpha = (1.0 - ci_level) / 2.0
+    if draws:
+        # Indeks bo'yicha tartiblab, natija bo'laklar tugash tartibiga bog'liq bo'lmasin
+        mat = np.array(
+            [[np.nan if v is None else float(v) for v in draws[i]] for i in sorted(draws)],
+            dtype=float,
+        )
+    else:
+        mat = np.full((0, n_items), np.nan)
+
+    per_item: List[Dict[str, Any]] = []
+    for j in range(n_items):
+        col = mat[:, j] if mat.shape[0] else np.array([], dtype=float)
+        col = col[np.isfinite(col)]
+        if col.size >= 2:
+            se = float(np.std(col, ddof=1))
+            lo, hi = (float(v) for v in np.percentile(col, [100 * alpha, 100 * (1 - alpha)]))
+        else:
+            se, lo, hi = None, None, None
+        per_item.append({"se": se, "ci_low": lo, "ci_high": hi, "n_replicates": int(col.size)})
+
+    return {
+        "replicates": replicates,
+        "successful": len(draws),
+        "failed": failed,
+        "seed": seed,
+        "ci_level": ci_level,
+        "items": per_item,
+    }
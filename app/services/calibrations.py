@@ -0,0 +1,400 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.cleaning import SheetLayout
+from app.core.settings import settings
+from app.core.storage import file_lock, owner_key, read_json, write_json
+from app.services.cat import ItemBank
+
+Row = List[Optional[int]]
+
+
+def row_keys(rows: List[List[Any]], kept: Sequence[int], layout: SheetLayout, cleaned: Sequence[Row]) -> List[str]:
+    """Har bir saqlangan qator uchun barqaror kalit: label ustunlari (ism, ID) bo'lsa ular,
+    bo'lmasa javoblar fingerprint'i. Takrorlangan kalitlarga ``#2``, ``#3`` qo'shiladi."""
+    keys: List[str] = []
+    seen: Dict[str, int] = {}
+    for i, row in zip(kept, cleaned):
+        raw = rows[i]
+        labels = [str(raw[j]).strip() for j in layout.label_columns if j < len(raw) and raw[j] is not None]
+        if any(labels):
+            key = "label:" + "|".join(labels)
+        else:
+            content = ",".join("" if v is None else str(v) for v in row)
+            key = "row:" + hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+
+def _item_stats(matrix: Sequence[Row], n_items: int) -> Tuple[List[int], List[int]]:
+    # Rasch uchun yetarli statistikalar: har bir item bo'yicha to'g'ri javoblar va kuzatuvlar soni
+    sums = [0] * n_items
+    counts = [0] * n_items
+    for row in matrix:
+        for j, v in enumerate(row):
+            if v is not None:
+                counts[j] += 1
+                sums[j] += v
+    return sums, counts
+
+
+@dataclass
+class RowDiff:
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    @property
+    def empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+
+def diff_rows(old: Dict[str, Row], new_keys: Sequence[str], new_rows: Sequence[Row]) -> RowDiff:
+    diff = RowDiff()
+    new_keyset = set(new_keys)
+    for key, row in zip(new_keys, new_rows):
+        prev = old.get(key)
+        if prev is None:
+            diff.added.append(key)
+        elif list(prev) != list(row):
+            diff.changed.append(key)
+        else:
+            diff.unchanged += 1
+    diff.removed = [key for key in old if key not in new_keyset]
+    return diff
+
+
+def update_item_stats(
+    sums: List[int],
+    counts: List[int],
+    old: Dict[str, Row],
+    new: Dict[str, Row],
+    diff: RowDiff,
+) -> Tuple[List[int], List[int]]:
+    """Yetarli statistikalarni faqat o'zgargan qatorlar bo'yicha yangilaydi."""
+    sums, counts = list(sums), list(counts)
+    for key in diff.removed + diff.changed:
+        for j, v in enumerate(old[key]):
+            if v is not None:
+                counts[j] -= 1
+                sums[j] -= v
+    for key in diff.added + diff.changed:
+        for j, v in enumerate(new[key]):
+            if v is not None:
+                counts[j] += 1
+                sums[j] += v
+    return sums, counts
+
+
+def p_value_drift(old: Tuple[List[int], List[int]], new: Tuple[List[int], List[int]]) -> Tuple[float, float]:
+    """Itemlar to'g'ri javob ulushining eng katta siljishi: (mutlaq, standart xatolarda).
+
+    Standart xato ``sqrt(p(1-p)/N)`` — bitta katakni tuzatish p ni 1/N ga suradi, shuning uchun
+    chegara namunaning hajmiga bog'liq bo'lmasligi uchun siljish SE birliklarida o'lchanadi.
+    p bo'yicha z SE siljish item qiyinchiligining taxminan z ta o'z SE siga siljishiga teng.
+    """
+    drift, drift_se = 0.0, 0.0
+    for s0, c0, s1, c1 in zip(old[0], old[1], new[0], new[1]):
+        if c0 == 0 or c1 == 0:
+            if c0 != c1:
+                return math.inf, math.inf
+            continue
+        delta = abs(s1 / c1 - s0 / c0)
+        # 0 yoki 1 ga teng ulushlarda SE nolga aylanmasligi uchun (s + 0.5) / (c + 1)
+        p = (s0 + 0.5) / (c0 + 1.0)
+        drift = max(drift, delta)
+        drift_se = max(drift_se, delta / math.sqrt(p * (1.0 - p) / c1))
+    return drift, drift_se
+
+
+class CalibrationStore:
+    """Saqlangan kalibrlashlar (matritsa, qator kalitlari, item parametrlari, shaxs natijalari).
+
+    Har bir egasi uchun alohida katalog: har bir kalibrlash alohida JSON faylda, ``index.json`` esa
+    header fingerprint -> oxirgi kalibrlash. Yozish faqat shu egasining indeksini fayl qulfi ostida
+    yangilaydi; muddati o'tgan fayllar ``prune_interval`` soniyada bir marta (barcha worker'lar
+    bo'yicha) tozalanadi.
+    """
+
+    def __init__(self, root: Path, ttl: float, prune_interval: float = 3600.0) -> None:
+        self.root = root
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._next_prune = 0.0
+
+    def _owner_dir(self, owner: str) -> Path:
+        return self.root / owner_key(owner)
+
+    def _path(self, owner: str, calibration_id: str) -> Path:
+        return self._owner_dir(owner) / f"{owner_key(calibration_id)}.json"
+
+    def get(self, owner: str, calibration_id: str) -> Optional[Dict[str, Any]]:
+        record = read_json(self._path(owner, calibration_id))
+        if not isinstance(record, dict) or time.time() - record.get("updated_at", 0) > self.ttl:
+            return None
+        return record
+
+    def latest(self, owner: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        index = read_json(self._owner_dir(owner) / "index.json") or {}
+        calibration_id = index.get(fingerprint)
+        return self.get(owner, calibration_id) if calibration_id else None
+
+    def put(self, owner: str, record: Dict[str, Any]) -> None:
+        record["updated_at"] = time.time()
+        write_json(self._path(owner, record["calibration_id"]), record)
+        fingerprint = record.get("fingerprint")
+        if fingerprint:
+            index_path = self._owner_dir(owner) / "index.json"
+            index = read_json(index_path) or {}
+            if index.get(fingerprint) != record["calibration_id"]:
+                with file_lock(index_path):
+                    index = read_json(index_path) or {}
+                    index[fingerprint] = record["calibration_id"]
+                    write_json(index_path, index)
+        self._maybe_prune()
+
+    def _maybe_prune(self) -> None:
+        # Har bir yozishda butun katalogni ko'rib chiqmaymiz: oxirgi tozalash vaqti umumiy belgi faylida
+        now = time.time()
+        if now < self._next_prune:
+            return
+        stamp = self.root / ".pruned"
+        with file_lock(stamp):
+            try:
+                last = stamp.stat().st_mtime
+            except OSError:
+                last = 0.0
+            if now - last < self.prune_interval:
+                self._next_prune = last + self.prune_interval
+                return
+            stamp.touch()
+            self._next_prune = now + self.prune_interval
+        self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        for owner_dir in self.root.iterdir():
+            if not owner_dir.is_dir():
+                continue
+            index_path = owner_dir / "index.json"
+            with file_lock(index_path):
+                remaining = 0
+                for path in owner_dir.glob("*.json"):
+                    if path.name == "index.json":
+                        continue
+                    try:
+                        if now - path.stat().st_mtime > self.ttl:
+                            path.unlink()
+                        else:
+                            remaining += 1
+                    except OSError:
+                        pass
+                if not remaining:
+                    # Egasining barcha kalibrlashlari eskirgan — indeksni ham o'chiramiz
+                    try:
+                        index_path.unlink()
+                    except OSError:
+                        pass
+
+
+calibration_store = CalibrationStore(
+    settings.calibration_store_path,
+    ttl=settings.calibration_ttl,
+    prune_interval=settings.calibration_prune_interval,
+)
+
+
+def _matching_previous(
+    owner: str,
+    sheet_id: Optional[str],
+    fingerprint: Optional[str],
+    keys: Sequence[str],
+    n_items: int,
+    store: CalibrationStore,
+) -> Optional[Dict[str, Any]]:
+    if sheet_id:
+        record = store.get(owner, sheet_id)
+    elif fingerprint:
+        record = store.latest(owner, fingerprint)
+        # Qator fingerprint'lari bo'yicha: kamida yarmi mos kelsa — bu qayta yuborish
+        if record is not None:
+            overlap = len(set(keys) & set(record.get("row_keys") or []))
+            if overlap * 2 < max(len(keys), len(record.get("row_keys") or [])):
+                record = None
+    else:
+        record = None
+    if record is None or record.get("n_items") != n_items:
+        return None
+    return record
+
+
+# Ma'lumotlar o'zgarganda saqlangan kalibrlashdan olib bo'lmaydigan item statistikalari
+_STALE_ITEM_FIELDS = ("infit", "outfit", "pt_biserial")
+
+# Bundan kichik EAP farqi o'zgarish hisoblanmaydi (JSON orqali aylanish xatolari)
+_EAP_EPS = 1e-6
+
+
+def _rescore(record: Dict[str, Any], keys: Sequence[str], new_rows: Dict[str, Row]) -> List[Dict[str, Any]]:
+    # Barcha shaxslar bitta usulda (saqlangan item parametrlari, kvadratura) skorlanadi — natija ichida
+    # ltm EAP'lari va kvadratura EAP'lari aralashmasin
+    bank = ItemBank(record["items"])
+    out = bank.score_patterns([new_rows[k] for k in keys])
+    persons: List[Dict[str, Any]] = []
+    for idx in range(len(keys)):
+        values = {name: float(out[name][idx]) for name in ("eap", "se", "infit", "outfit")}
+        persons.append({"person_index": idx + 1, **{k: (v if math.isfinite(v) else None) for k, v in values.items()}})
+    return persons
+
+
+def _eap_moved(before: Optional[float], after: Optional[float]) -> bool:
+    if before is None or after is None:
+        return before is not after
+    return abs(after - before) > _EAP_EPS
+
+
+def run_incremental(
+    cleaned: Sequence[Row],
+    keys: Sequence[str],
+    owner: str,
+    fingerprint: Optional[str],
+    run_full: Callable[[], Dict[str, Any]],
+    sheet_id: Optional[str] = None,
+    tolerance: float = 0.5,
+    store: Optional[CalibrationStore] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Avvalgi kalibrlash bilan qatorlar farqini hisoblab, kerak bo'lsagina qayta moslashtiradi.
+
+    ``run_full`` — to'liq hisoblash (R orqali); natija ``items``/``persons``/``fit`` bloklarini qaytaradi.
+    Qaytaradi: (natija, o'zgarishlar jurnali).
+    """
+    store = store or calibration_store
+    n_items = len(cleaned[0]) if cleaned else 0
+    # Header'siz (faqat raqamli) jadvallar uchun ham qator fingerprint'lari bo'yicha qidiramiz
+    fingerprint = fingerprint or f"items:{n_items}"
+    new_rows = dict(zip(keys, (list(r) for r in cleaned)))
+    previous = _matching_previous(owner, sheet_id, fingerprint, keys, n_items, store)
+
+    changelog: Dict[str, Any] = {"mode": "full", "tolerance": tolerance}
+    if previous is None:
+        result = run_full()
+        current = fitted = _item_stats(cleaned, n_items)
+        scoring = "ltm"
+    else:
+        old_rows = dict(zip(previous["row_keys"], previous["matrix"]))
+        diff = diff_rows(old_rows, keys, cleaned)
+        current = update_item_stats(previous["item_sums"], previous["item_counts"], old_rows, new_rows, diff)
+        # Siljish oxirgi moslashtirishdagi statistikalarga nisbatan — kichik tuzatishlar yig'ilib ketmasin
+        fitted = (previous["fit_item_sums"], previous["fit_item_counts"])
+        drift, drift_se = p_value_drift(fitted, current)
+        changelog.update(
+            previous_calibration_id=previous["calibration_id"],
+            added=diff.added,
+            removed=diff.removed,
+            changed=diff.changed,
+            unchanged=diff.unchanged,
+            p_value_drift=drift if math.isfinite(drift) else None,
+            p_value_drift_se=drift_se if math.isfinite(drift_se) else None,
+        )
+        old_persons = dict(zip(previous["row_keys"], previous["persons"]))
+        result = None
+        scoring = previous.get("person_scoring", "ltm")
+        if diff.empty and math.isfinite(drift_se) and drift_se <= tolerance:
+            # Ma'lumotlar aynan o'sha — saqlangan natija to'liq amal qiladi
+            mode = "unchanged"
+            result = {
+                "items": previous["items"],
+                "persons": [
+                    {"person_index": idx, **old_persons[key]} for idx, key in enumerate(keys, start=1)
+                ],
+                "fit": previous.get("fit"),
+            }
+        elif math.isfinite(drift_se) and drift_se <= tolerance:
+            mode = "rescored"
+            try:
+                persons = _rescore(previous, keys, new_rows)
+            except (TypeError, ValueError, KeyError):
+                # Saqlangan item parametrlari bilan skorlab bo'lmadi — to'liq hisoblashga o'tamiz
+                persons = None
+            if persons is not None:
+                scoring = "quadrature"
+                # logLik/AIC/BIC va item moslik statistikalari eski matritsaga tegishli — ularni qaytarmaymiz
+                result = {
+                    "items": [{**item, **{k: None for k in _STALE_ITEM_FIELDS}} for item in previous["items"]],
+                    "persons": persons,
+                    "fit": {
+                        "n_obs": len(keys),
+                        "n_items": n_items,
+                        "logLik": None,
+                        "AIC": None,
+                        "BIC": None,
+                        "stale": True,
+                    },
+                }
+        if result is None:
+            mode = "refit"
+            result = run_full()
+            fitted = current
+            scoring = "ltm"
+        changelog["mode"] = mode
+
+        index_by_key = {key: idx for idx, key in enumerate(keys, start=1)}
+        new_persons = {key: p for key, p in zip(keys, result.get("persons") or [])}
+        affected = []
+        for change, group in (("added", diff.added), ("changed", diff.changed), ("removed", diff.removed)):
+            for key in group:
+                before = old_persons.get(key, {}).get("eap")
+                after = new_persons.get(key, {}).get("eap")
+                affected.append({
+                    "key": key,
+                    "change": change,
+                    "person_index": index_by_key.get(key),
+                    "eap_before": before,
+                    "eap_after": after,
+                })
+        # Qatori o'zgarmagan, lekin bahosi siljigan shaxslar ham (qayta skorlash yoki qayta moslashtirishda)
+        touched = set(diff.added) | set(diff.changed)
+        for key in keys:
+            if key in touched:
+                continue
+            before = old_persons.get(key, {}).get("eap")
+            after = new_persons.get(key, {}).get("eap")
+            if _eap_moved(before, after):
+                affected.append({
+                    "key": key,
+                    "change": "score_changed",
+                    "person_index": index_by_key.get(key),
+                    "eap_before": before,
+                    "eap_after": after,
+                })
+        changelog["affected_persons"] = affected
+
+    changelog["person_scoring"] = scoring
+    calibration_id = sheet_id or uuid.uuid4().hex
+    store.put(owner, {
+        "calibration_id": calibration_id,
+        "fingerprint": fingerprint,
+        "n_items": n_items,
+        "row_keys": list(keys),
+        "matrix": [list(r) for r in cleaned],
+        "item_sums": list(current[0]),
+        "item_counts": list(current[1]),
+        "fit_item_sums": list(fitted[0]),
+        "fit_item_counts": list(fitted[1]),
+        "items": result.get("items") or [],
+        "persons": [
+            {name: p.get(name) for name in ("eap", "se", "infit", "outfit")} for p in result.get("persons") or []
+        ],
+        "fit": result.get("fit"),
+        "person_scoring": scoring,
+    })
+    changelog["calibration_id"] = calibration_id
+    return result, changelog
@@ -0,0 +1,372 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.settings import settings
+from app.core.state import StateDB, state_db
+
+
+@dataclass(frozen=True)
+class CatConfig:
+    se_target: float = 0.3
+    max_items: int = 20
+    min_items: int = 3
+
+
+class ItemBank:
+    """Kalibrlangan itemlar banki (``/calculate`` natijasidagi ``items``).
+
+    Kvadratura to'ri, har bir item uchun log P / log(1-P) jadvallari va har bir to'r nuqtasi
+    uchun itemlarning informatsiya bo'yicha tartibi bir marta oldindan hisoblanadi.
+    """
+
+    def __init__(self, items: Sequence[Dict[str, Any]], grid_points: int = 81, theta_bound: float = 4.0) -> None:
+        if not items:
+            raise ValueError("Item banki bo'sh bo'lmasligi kerak")
+        self.item_ids: List[str] = [str(it.get("item_id") or f"Item{k}") for k, it in enumerate(items, start=1)]
+        if len(set(self.item_ids)) != len(self.item_ids):
+            raise ValueError("item_id qiymatlari takrorlanmasligi kerak")
+        b = np.array([float(it["difficulty"]) for it in items], dtype=float)
+        a = np.array([float(it.get("discrimination") or 1.0) for it in items], dtype=float)
+        if not (np.all(np.isfinite(b)) and np.all(np.isfinite(a)) and np.all(a > 0)):
+            raise ValueError("Item parametrlari chekli bo'lishi, diskriminatsiya musbat bo'lishi kerak")
+
+        self.difficulty = b
+        self.discrimination = a
+        self.grid = np.linspace(-theta_bound, theta_bound, grid_points)
+        self.log_prior = -0.5 * self.grid ** 2  # N(0, 1), ltm bilan bir xil
+
+        p = 1.0 / (1.0 + np.exp(-a[:, None] * (self.grid[None, :] - b[:, None])))
+        p = np.clip(p, 1e-12, 1.0 - 1e-12)
+        self.log_p = np.log(p)
+        self.log_q = np.log1p(-p)
+
+        # Informatsiya indeksi: har bir to'r nuqtasida itemlar informatsiya kamayishi tartibida
+        info = (a[:, None] ** 2) * p * (1.0 - p)
+        self.info_order = np.argsort(-info, axis=0, kind="stable").T  # (to'r, item)
+        self._index_by_id = {item_id: k for k, item_id in enumerate(self.item_ids)}
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
+
+    def index_of(self, item_id: str) -> Optional[int]:
+        return self._index_by_id.get(item_id)
+
+    def score_patterns(self, patterns: Sequence[Sequence[Optional[int]]]) -> Dict[str, np.ndarray]:
+        """Berilgan javob andozalari uchun EAP, posterior SD va shaxs infit/outfit (vektorlashtirilgan)."""
+        x = np.array([[np.nan if v is None else float(v) for v in row] for row in patterns], dtype=float)
+        mask = ~np.isnan(x)
+        x0 = np.where(mask, x, 0.0)
+        log_post = self.log_prior[None, :] + x0 @ self.log_p + (mask - x0) @ self.log_q
+        w = np.exp(log_post - log_post.max(axis=1, keepdims=True))
+        w /= w.sum(axis=1, keepdims=True)
+        theta = w @ self.grid
+        se = np.sqrt(np.maximum(w @ self.grid ** 2 - theta ** 2, 0.0))
+
+        p = 1.0 / (1.0 + np.exp(-self.discrimination[None, :] * (theta[:, None] - self.difficulty[None, :])))
+        var = np.where(mask, p * (1.0 - p), 0.0)
+        r2 = np.where(mask, (x0 - p) ** 2, 0.0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            outfit = np.where(var > 0, r2 / var, 0.0).sum(axis=1) / mask.sum(axis=1)
+            infit = r2.sum(axis=1) / var.sum(axis=1)
+        return {"eap": theta, "se": se, "infit": infit, "outfit": outfit}
+
+    def next_item(self, theta: float, used: np.ndarray) -> Optional[int]:
+        g = int(np.clip(np.searchsorted(self.grid, theta), 0, len(self.grid) - 1))
+        if g > 0 and abs(self.grid[g - 1] - theta) < abs(self.grid[g] - theta):
+            g -= 1
+        for k in self.info_order[g]:
+            if not used[k]:
+                return int(k)
+        return None
+
+
+@dataclass
+class CatSession:
+    session_id: str
+    bank_id: str
+    bank: ItemBank
+    config: CatConfig
+    log_post: np.ndarray
+    used: np.ndarray
+    responses: List[Tuple[int, int]] = field(default_factory=list)
+    current: Optional[int] = None
+    finished: bool = False
+    stop_reason: Optional[str] = None
+    theta: float = 0.0
+    se: float = 1.0
+
+    @classmethod
+    def from_state(cls, session_id: str, bank_id: str, bank: ItemBank, state: Dict[str, Any]) -> "CatSession":
+        # Posterior holat bilan birga saqlanadi — javoblar bo'yicha qaytadan yig'ilmaydi
+        responses = [(int(k), int(r)) for k, r in state["responses"]]
+        used = np.zeros(len(bank), dtype=bool)
+        for k, _ in responses:
+            used[k] = True
+        return cls(
+            session_id=session_id,
+            bank_id=bank_id,
+            bank=bank,
+            config=CatConfig(**state["config"]),
+            log_post=np.array(state["log_post"], dtype=float),
+            used=used,
+            responses=responses,
+            current=state["current"],
+            finished=state["finished"],
+            stop_reason=state["stop_reason"],
+            theta=state["theta"],
+            se=state["se"],
+        )
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "config": asdict(self.config),
+            "log_post": self.log_post.tolist(),
+            "responses": self.responses,
+            "current": self.current,
+            "finished": self.finished,
+            "stop_reason": self.stop_reason,
+            "theta": self.theta,
+            "se": self.se,
+        }
+
+    def _estimate(self) -> None:
+        w = np.exp(self.log_post - self.log_post.max())
+        w /= w.sum()
+        self.theta = float(w @ self.bank.grid)
+        self.se = float(np.sqrt(w @ (self.bank.grid - self.theta) ** 2))
+
+    def _advance(self) -> None:
+        n = len(self.responses)
+        if n >= self.config.max_items:
+            self.finished, self.stop_reason = True, "max_items"
+        elif n >= self.config.min_items and self.se <= self.config.se_target:
+            self.finished, self.stop_reason = True, "se_target"
+        else:
+            self.current = self.bank.next_item(self.theta, self.used)
+            if self.current is None:
+                self.finished, self.stop_reason = True, "bank_exhausted"
+        if self.finished:
+            self.current = None
+
+    def answer(self, item_id: str, response: int) -> None:
+        if self.finished:
+            raise ValueError("Sessiya yakunlangan")
+        k = self.bank.index_of(item_id)
+        if k is None or k != self.current:
+            expected = None if self.current is None else self.bank.item_ids[self.current]
+            raise ValueError(f"Kutilgan item: {expected}, berilgan: {item_id}")
+        # Posteriorni qayta hisoblamasdan, faqat shu item log-ehtimolini qo'shamiz
+        self.log_post += self.bank.log_p[k] if response else self.bank.log_q[k]
+        self.log_post -= self.log_post.max()
+        self.used[k] = True
+        self.responses.append((k, int(response)))
+        self._estimate()
+        self._advance()
+
+    def to_dict(self) -> Dict[str, Any]:
+        ids = self.bank.item_ids
+        nxt = None
+        if self.current is not None:
+            nxt = {
+                "item_id": ids[self.current],
+                "difficulty": float(self.bank.difficulty[self.current]),
+            }
+        return {
+            "session_id": self.session_id,
+            "bank_id": self.bank_id,
+            "theta": round(self.theta, 6),
+            "se": round(self.se, 6),
+            "n_answered": len(self.responses),
+            "finished": self.finished,
+            "stop_reason": self.stop_reason,
+            "next_item": nxt,
+            "responses": [{"item_id": ids[k], "response": r} for k, r in self.responses],
+        }
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cat_banks (
+    bank_id TEXT PRIMARY KEY,
+    items TEXT NOT NULL,
+    ttl REAL NOT NULL,
+    touched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cat_sessions (
+    session_id TEXT PRIMARY KEY,
+    bank_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    touched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cat_sessions_touched_at ON cat_sessions(touched_at);
+"""
+
+# Har bir worker'da oldindan hisoblangan banklar keshi (banklar o'zgarmas)
+_BANK_CACHE_SIZE = 64
+
+
+class CatService:
+    """CAT banklari va sessiyalari umumiy bazada: har bir javob bitta tranzaksiyada o'qiladi va yoziladi,
+    shuning uchun sessiya istalgan worker'da davom etadi. ``ItemBank`` jadvallari worker ichida keshlanadi."""
+
+    def __init__(self, session_ttl: float, max_sessions: int, max_banks: int, db: StateDB) -> None:
+        self.session_ttl = session_ttl
+        self.bank_ttl = max(session_ttl, 24 * 3600.0)
+        self.max_sessions = max_sessions
+        self.max_banks = max_banks
+        self.db = db
+        db.register_schema(_SCHEMA)
+        self._banks: "OrderedDict[str, ItemBank]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def _purge(self, conn: sqlite3.Connection, now: float, force: bool = False) -> None:
+        # Muddati o'tganlarni o'chirish — soniyasiga ko'pi bilan bir marta (yoki joy tugaganda)
+        if not force and now - self._last_purge < 1.0:
+            return
+        self._last_purge = now
+        conn.execute("DELETE FROM cat_sessions WHERE touched_at < ?", (now - self.session_ttl,))
+        conn.execute("DELETE FROM cat_banks WHERE touched_at + ttl < ?", (now,))
+
+    def _bank(self, bank_id: str, items_json: str) -> ItemBank:
+        with self._lock:
+            bank = self._banks.get(bank_id)
+            if bank is not None:
+                self._banks.move_to_end(bank_id)
+                return bank
+        bank = ItemBank(json.loads(items_json))
+        with self._lock:
+            self._banks[bank_id] = bank
+            while len(self._banks) > _BANK_CACHE_SIZE:
+                self._banks.popitem(last=False)
+        return bank
+
+    def register_bank(self, items: Sequence[Dict[str, Any]], inline: bool = False) -> Tuple[str, ItemBank]:
+        """Bank identifikatori item parametrlari hash'i: bir xil bank qayta yuborilsa yangi yozuv yaratilmaydi.
+
+        ``inline`` — sessiya bilan birga yuborilgan bank: muddati sessiyalar muddatiga teng va
+        uni ishlatayotgan sessiyalarga har murojaatda uzayadi.
+        """
+        bank = ItemBank(items)
+        canonical = [
+            {"item_id": item_id, "difficulty": float(b), "discrimination": float(a)}
+            for item_id, b, a in zip(bank.item_ids, bank.difficulty, bank.discrimination)
+        ]
+        items_json = json.dumps(canonical, ensure_ascii=False, sort_keys=True)
+        bank_id = hashlib.sha1(items_json.encode("utf-8")).hexdigest()
+        ttl = self.session_ttl if inline else self.bank_ttl
+        now = time.time()
+        with self.db.transaction() as conn:
+            self._purge(conn, now)
+            exists = conn.execute("SELECT 1 FROM cat_banks WHERE bank_id = ?", (bank_id,)).fetchone() is not None
+            if not exists and conn.execute("SELECT COUNT(*) FROM cat_banks").fetchone()[0] >= self.max_banks:
+                self._purge(conn, now, force=True)
+                if conn.execute("SELECT COUNT(*) FROM cat_banks").fetchone()[0] >= self.max_banks:
+                    raise OverflowError("Item banklari uchun joy tugadi")
+            conn.execute(
+                "INSERT INTO cat_banks (bank_id, items, ttl, touched_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(bank_id) DO UPDATE SET ttl = MAX(ttl, excluded.ttl), touched_at = excluded.touched_at",
+                (bank_id, items_json, ttl, now),
+            )
+        with self._lock:
+            self._banks[bank_id] = bank
+        return bank_id, bank
+
+    def start(self, bank_id: str, config: CatConfig, start_theta: float = 0.0) -> CatSession:
+        now = time.time()
+        with self.db.transaction() as conn:
+            self._purge(conn, now)
+            row = conn.execute(
+                "SELECT items FROM cat_banks WHERE bank_id = ? AND touched_at + ttl >= ?", (bank_id, now)
+            ).fetchone()
+            if row is None:
+                raise KeyError(bank_id)
+            bank = self._bank(bank_id, row["items"])
+            session = CatSession(
+                session_id=uuid.uuid4().hex,
+                bank_id=bank_id,
+                bank=bank,
+                config=config,
+                log_post=bank.log_prior.copy(),
+                used=np.zeros(len(bank), dtype=bool),
+            )
+            session._estimate()
+            session.theta = start_theta
+            session._advance()
+            if conn.execute("SELECT COUNT(*) FROM cat_sessions").fetchone()[0] >= self.max_sessions:
+                self._purge(conn, now, force=True)
+                if conn.execute("SELECT COUNT(*) FROM cat_sessions").fetchone()[0] >= self.max_sessions:
+                    raise OverflowError("Sessiyalar uchun joy tugadi")
+            conn.execute("UPDATE cat_banks SET touched_at = ? WHERE bank_id = ?", (now, bank_id))
+            conn.execute(
+                "INSERT INTO cat_sessions (session_id, bank_id, state, touched_at) VALUES (?, ?, ?, ?)",
+                (session.session_id, bank_id, json.dumps(session.state()), now),
+            )
+        return session
+
+    def _load(self, conn: sqlite3.Connection, session_id: str, now: float) -> Optional[CatSession]:
+        row = conn.execute(
+            "SELECT s.bank_id, s.state, b.items FROM cat_sessions s JOIN cat_banks b ON b.bank_id = s.bank_id "
+            "WHERE s.session_id = ? AND s.touched_at >= ?",
+            (session_id, now - self.session_ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        bank = self._bank(row["bank_id"], row["items"])
+        return CatSession.from_state(session_id, row["bank_id"], bank, json.loads(row["state"]))
+
+    def _touch(self, conn: sqlite3.Connection, session: CatSession, now: float) -> None:
+        # Sessiya ishlatayotgan bank ham uzaytiriladi: inline bank sessiyalari tugamaguncha yashaydi
+        conn.execute("UPDATE cat_sessions SET touched_at = ? WHERE session_id = ?", (now, session.session_id))
+        conn.execute("UPDATE cat_banks SET touched_at = ? WHERE bank_id = ?", (now, session.bank_id))
+
+    def get(self, session_id: str) -> Optional[CatSession]:
+        now = time.time()
+        with self.db.transaction() as conn:
+            session = self._load(conn, session_id, now)
+            if session is not None:
+                # Har bir murojaat muddatni yangilaydi
+                self._touch(conn, session, now)
+        return session
+
+    def answer(self, session_id: str, item_id: str, response: int) -> Optional[CatSession]:
+        # O'qish-javob-yozish bitta tranzaksiyada: bir sessiyaga parallel javoblar ketma-ketlashadi
+        now = time.time()
+        with self.db.transaction() as conn:
+            session = self._load(conn, session_id, now)
+            if session is None:
+                return None
+            session.answer(item_id, response)
+            conn.execute("UPDATE cat_sessions SET state = ? WHERE session_id = ?", (json.dumps(session.state()), session_id))
+            self._touch(conn, session, now)
+        return session
+
+    def end(self, session_id: str) -> Optional[CatSession]:
+        with self.db.transaction() as conn:
+            session = self._load(conn, session_id, time.time())
+            conn.execute("DELETE FROM cat_sessions WHERE session_id = ?", (session_id,))
+        return session
+
+    def session_count(self) -> int:
+        row = self.db.connect().execute(
+            "SELECT COUNT(*) FROM cat_sessions WHERE touched_at >= ?", (time.time() - self.session_ttl,)
+        ).fetchone()
+        return int(row[0])
+
+
+cat_service = CatService(
+    session_ttl=settings.cat_session_ttl,
+    max_sessions=settings.cat_max_sessions,
+    max_banks=settings.cat_max_banks,
+    db=state_db,
+)
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, List, Optional, Sequence
+
+# ETS tasnifi (logit shkalasida): |farq| < 0.43 — A (ahamiyatsiz), >= 0.64 — C (katta)
+ETS_B_THRESHOLD = 0.43
+ETS_C_THRESHOLD = 0.64
+
+
+def _normal_two_sided_p(z: float) -> float:
+    return math.erfc(abs(z) / math.sqrt(2.0))
+
+
+def _holm_adjust(p_values: Sequence[Optional[float]]) -> List[Optional[float]]:
+    indexed = sorted((p, i) for i, p in enumerate(p_values) if p is not None)
+    m = len(indexed)
+    adjusted: List[Optional[float]] = [None] * len(p_values)
+    running = 0.0
+    for rank, (p, i) in enumerate(indexed):
+        running = max(running, min(1.0, (m - rank) * p))
+        adjusted[i] = running
+    return adjusted
+
+
+def _to_logits(values: Sequence[Optional[float]], discrimination: Optional[float]) -> List[Optional[float]]:
+    # ltm IRT parametrlashi: a(theta - b), har bir guruhda theta ~ N(0,1). Guruh tarqoqligi sigma_g bo'lsa
+    # a_g = sigma_g va b_g = (b - mu_g) / sigma_g, demak a_g*b_g = b - mu_g — tarqoqlikka bog'liq emas
+    a = discrimination if discrimination is not None and discrimination > 0 else 1.0
+    return [None if v is None else a * v for v in values]
+
+
+def _centered(difficulties: Sequence[Optional[float]], anchor: Sequence[int]) -> List[Optional[float]]:
+    # Mean-mean bog'lash: logit shkalasida qolgan farq faqat joylashuv (mu_g) — umumiy itemlar o'rtachasi 0 bo'ladi
+    if not anchor:
+        return list(difficulties)
+    shift = sum(difficulties[j] for j in anchor) / len(anchor)  # type: ignore[misc]
+    return [None if b is None else b - shift for b in difficulties]
+
+
+def _category(contrast: float, p_adjusted: Optional[float], alpha: float) -> str:
+    significant = p_adjusted is not None and p_adjusted < alpha
+    if not significant or abs(contrast) < ETS_B_THRESHOLD:
+        return "A"
+    if abs(contrast) >= ETS_C_THRESHOLD:
+        return "C"
+    return "B"
+
+
+def _usable(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        return None
+    return v if math.isfinite(v) else None
+
+
+def dif_contrasts(
+    engine_result: Dict[str, Any],
+    item_ids: Sequence[str],
+    reference_group: Optional[str] = None,
+    alpha: float = 0.05,
+) -> Dict[str, Any]:
+    """Har bir fokal guruh va item uchun qiyinchilik farqi (fokal − referens), Wald z-testi va Holm tuzatishi."""
+    n_items = len(item_ids)
+    groups = [g for g in engine_result.get("groups") or [] if not g.get("error")]
+    failed = [{"group": g.get("group"), "error": g.get("error")} for g in engine_result.get("groups") or [] if g.get("error")]
+
+    if reference_group is None and groups:
+        reference_group = max(groups, key=lambda g: g.get("n_persons") or 0).get("group")
+    ref = next((g for g in groups if g.get("group") == reference_group), None)
+    if ref is None:
+        raise ValueError(f"Referens guruh topilmadi yoki baholanmadi: {reference_group}")
+
+    # Har bir guruh o'z diskriminatsiyasi bilan baholanadi — avval a*b (logit) shkalasiga o'tkaziladi
+    diffs = {
+        g["group"]: _to_logits([_usable(v) for v in g.get("difficulty") or [None] * n_items], _usable(g.get("discrimination")))
+        for g in groups
+    }
+    ses = {
+        g["group"]: _to_logits([_usable(v) for v in g.get("se") or [None] * n_items], _usable(g.get("discrimination")))
+        for g in groups
+    }
+
+    # Barcha guruhlarda baholangan itemlar — bog'lash uchun yakor
+    anchor = [j for j in range(n_items) if all(diffs[name][j] is not None for name in diffs)]
+    centered = {name: _centered(values, anchor) for name, values in diffs.items()}
+
+    contrasts: List[Dict[str, Any]] = []
+    for g in groups:
+        focal = g["group"]
+        if focal == reference_group:
+            continue
+        rows: List[Dict[str, Any]] = []
+        for j in range(n_items):
+            bf, br = centered[focal][j], centered[reference_group][j]
+            sf, sr = ses[focal][j], ses[reference_group][j]
+            row: Dict[str, Any] = {
+                "item_id": item_ids[j],
+                "focal_group": focal,
+                "reference_group": reference_group,
+                "difficulty_focal": bf,
+                "difficulty_reference": br,
+                "contrast": None,
+                "se": None,
+                "z": None,
+                "p_value": None,
+            }
+            if bf is not None and br is not None and sf is not None and sr is not None and (sf > 0 or sr > 0):
+                contrast = bf - br
+                se = math.sqrt(sf * sf + sr * sr)
+                z = contrast / se
+                row.update(contrast=contrast, se=se, z=z, p_value=_normal_two_sided_p(z))
+            rows.append(row)
+        for row, p_adj in zip(rows, _holm_adjust([r["p_value"] for r in rows])):
+            row["p_adjusted"] = p_adj
+            row["category"] = None if row["contrast"] is None else _category(row["contrast"], p_adj, alpha)
+        contrasts.extend(rows)
+
+    return {
+        "reference_group": reference_group,
+        "anchor_items": [item_ids[j] for j in anchor],
+        "alpha": alpha,
+        "contrasts": contrasts,
+        "failed_groups": failed,
+    }
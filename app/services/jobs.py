@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from app.core.admission import AdmissionRejected
+from app.core.r_runner import EngineCancelledError
+from app.core.settings import settings
+from app.core.state import StateDB, state_db
+
+# Boshqa worker'dan kelgan bekor qilish so'rovlarini tekshirish oralig'i, soniya
+_CANCEL_POLL = 0.5
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    completed INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    pid INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs(finished_at);
+"""
+
+
+@dataclass
+class Job:
+    job_id: str
+    kind: str
+    status: str = "queued"  # queued | running | done | failed | cancelled
+    stage: Optional[str] = None
+    completed: int = 0
+    total: int = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    on_change: Optional[Callable[["Job"], None]] = field(default=None, repr=False)
+
+    def report(self, completed: int, total: Optional[int] = None, stage: Optional[str] = None) -> None:
+        self.completed = completed
+        if total is not None:
+            self.total = total
+        if stage is not None:
+            self.stage = stage
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": {
+                "completed": self.completed,
+                "total": self.total,
+                "ratio": round(self.completed / self.total, 4) if self.total else 0.0,
+            },
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+
+def _job_from_row(row: sqlite3.Row) -> Job:
+    return Job(
+        job_id=row["job_id"],
+        kind=row["kind"],
+        status=row["status"],
+        stage=row["stage"],
+        completed=row["completed"],
+        total=row["total"],
+        result=json.loads(row["result"]) if row["result"] else None,
+        error=row["error"],
+        created_at=row["created_at"],
+        finished_at=row["finished_at"],
+    )
+
+
+class JobManager:
+    """Uzoq davom etadigan hisoblashlar (masalan, bootstrap) uchun fon ishlari.
+
+    Ish uni qabul qilgan worker'ning pool'ida bajariladi, holati va natijasi esa umumiy bazada
+    saqlanadi: ``GET``/``DELETE /jobs/{id}`` istalgan worker'da ishlaydi. Navbatdagi ishlar soni
+    barcha worker'lar bo'yicha cheklangan; tugagan ishlar ``ttl`` soniyadan so'ng o'chiriladi.
+    """
+
+    def __init__(self, max_running: int, max_pending: int, ttl: float, db: StateDB) -> None:
+        self.max_running = max_running
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.db = db
+        db.register_schema(_SCHEMA)
+        self._executor = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="rasch-job")
+        self._local: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._watcher_pid: Optional[int] = None
+
+    def _save(self, job: Job, with_result: bool = False) -> None:
+        with self.db.transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = ?, completed = ?, total = ?, error = ?, finished_at = ?"
+                + (", result = ?" if with_result else "")
+                + " WHERE job_id = ?",
+                (
+                    job.status, job.stage, job.completed, job.total, job.error, job.finished_at,
+                    *((json.dumps(job.result, ensure_ascii=False),) if with_result else ()),
+                    job.job_id,
+                ),
+            )
+
+    def _ensure_watcher(self) -> None:
+        # Oqimlar fork'dan keyin saqlanmaydi — har bir worker o'z kuzatuvchisini ishga tushiradi
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch_cancellations, name="rasch-job-cancel", daemon=True).start()
+
+    def _watch_cancellations(self) -> None:
+        while True:
+            time.sleep(_CANCEL_POLL)
+            with self._lock:
+                local = {jid: job for jid, job in self._local.items() if not job.cancel_event.is_set()}
+            if not local:
+                continue
+            try:
+                rows = self.db.connect().execute(
+                    f"SELECT job_id FROM jobs WHERE cancel_requested = 1 AND job_id IN ({','.join('?' * len(local))})",
+                    tuple(local),
+                ).fetchall()
+            except sqlite3.Error:
+                continue
+            for row in rows:
+                local[row["job_id"]].cancel_event.set()
+
+    def submit(self, kind: str, fn: Callable[[Job], Dict[str, Any]]) -> Job:
+        job = Job(job_id=uuid.uuid4().hex, kind=kind, on_change=self._save)
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - self.ttl,))
+            unfinished = conn.execute("SELECT COUNT(*) FROM jobs WHERE finished_at IS NULL").fetchone()[0]
+            if unfinished >= self.max_running + self.max_pending:
+                raise AdmissionRejected(429, "Fon ishlari navbati to'la. Keyinroq urinib ko'ring.", settings.retry_after)
+            conn.execute(
+                "INSERT INTO jobs (job_id, kind, status, created_at, pid) VALUES (?, ?, ?, ?, ?)",
+                (job.job_id, job.kind, job.status, job.created_at, os.getpid()),
+            )
+        with self._lock:
+            self._local[job.job_id] = job
+        self._ensure_watcher()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Dict[str, Any]]) -> None:
+        try:
+            if job.cancel_event.is_set():
+                job.status = "cancelled"
+                return
+            job.status = "running"
+            self._save(job)
+            try:
+                job.result = fn(job)
+                job.status = "done"
+            except EngineCancelledError as e:
+                job.status = "cancelled"
+                job.error = str(e)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            self._save(job, with_result=job.result is not None)
+            with self._lock:
+                self._local.pop(job.job_id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        row = self.db.connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        if row["finished_at"] is not None and time.time() - row["finished_at"] > self.ttl:
+            return None
+        return _job_from_row(row)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        # Ish boshqa worker'da bajarilayotgan bo'lsa, uning kuzatuvchisi bayroqni ko'rib bekor qiladi
+        with self.db.transaction() as conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND finished_at IS NULL", (job_id,))
+        with self._lock:
+            local = self._local.get(job_id)
+        if local is not None:
+            local.cancel_event.set()
+        return self.get(job_id)
+
+    def fail_orphaned(self, pid: int) -> None:
+        """Yiqilgan worker'ning tugallanmagan ishlarini ``failed`` deb belgilaydi (ota jarayondan chaqiriladi)."""
+        with self.db.transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE pid = ? AND finished_at IS NULL",
+                ("Ishni bajarayotgan worker jarayoni to'xtadi", time.time(), pid),
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        rows = self.db.connect().execute(
+            "SELECT status, COUNT(*) AS n FROM jobs WHERE finished_at IS NULL GROUP BY status"
+        ).fetchall()
+        counts = {row["status"]: row["n"] for row in rows}
+        return {
+            "max_running": self.max_running,
+            "max_pending": self.max_pending,
+            "running": counts.get("running", 0),
+            "queued": counts.get("queued", 0),
+        }
+
+
+job_manager = JobManager(
+    max_running=settings.max_jobs,
+    max_pending=settings.max_pending_jobs,
+    ttl=settings.job_ttl,
+    db=state_db,
+)
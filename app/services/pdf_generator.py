@@ -12,6 +12,9 @@ import tempfile
 from typing import Dict, List, Any
 import numpy as np
 
+def _fmt(value: Any, digits: int = 3) -> str:
+    return f"{value:.{digits}f}" if isinstance(value, (int, float)) else 'N/A'
+
 def create_rasch_pdf_report(data: Dict[str, Any]) -> bytes:
     """
     Rasch model natijalaridan PDF hisobot yaratadi
@@ -76,14 +79,39 @@ def create_rasch_pdf_report(data: Dict[str, Any]) -> bytes:
     if items:
         story.append(Paragraph("Item Parametrlari (Qiyinchilik)", heading_style))
         
-        item_data = [["Item ID", "Qiyinchilik"]]
+        # Bootstrap natijalari bo'lsa, SE va ishonch oralig'i ustunlari qo'shiladi
+        has_se = any(item.get('se') is not None for item in items)
+        item_header = ["Item ID", "Qiyinchilik"]
+        if has_se:
+            ci_pct = int(round(100 * data.get('bootstrap', {}).get('ci_level', 0.95)))
+            item_header += ["SE", f"{ci_pct}% CI"]
+        # Fit statistikalari (infit/outfit MNSQ, point-biserial)
+        has_fit = any(item.get('infit') is not None for item in items)
+        if has_fit:
+            item_header += ["Infit", "Outfit", "Pt-bis"]
+        item_data = [item_header]
         for item in items:
-            item_data.append([
+            row = [
                 item.get('item_id', 'N/A'),
                 f"{item.get('difficulty', 0):.3f}"
-            ])
+            ]
+            if has_se:
+                se = item.get('se')
+                lo, hi = item.get('ci_low'), item.get('ci_high')
+                row.append(f"{se:.3f}" if se is not None else 'N/A')
+                row.append(f"[{lo:.3f}; {hi:.3f}]" if lo is not None and hi is not None else 'N/A')
+            if has_fit:
+                row += [_fmt(item.get('infit'), 2), _fmt(item.get('outfit'), 2), _fmt(item.get('pt_biserial'), 2)]
+            item_data.append(row)
         
-        item_table = Table(item_data, colWidths=[1.5*inch, 1.5*inch])
+        # Ustunlar ko'p bo'lsa A4 kengligiga sig'ishi uchun torroq
+        wide = not (has_se or has_fit)
+        col_widths = [1.5*inch, 1.5*inch] if wide else [1.1*inch, 0.9*inch]
+        if has_se:
+            col_widths += [0.6*inch, 1.3*inch]
+        if has_fit:
+            col_widths += [0.6*inch, 0.6*inch, 0.6*inch]
+        item_table = Table(item_data, colWidths=col_widths)
         item_table.setStyle(TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -104,18 +132,23 @@ def create_rasch_pdf_report(data: Dict[str, Any]) -> bytes:
         
         # Faqat birinchi 10 ta shaxsni ko'rsatamiz
         display_persons = persons[:10]
-        person_data = [["Shaxs", "EAP", "Standart Xato"]]
+        person_fit = any(person.get('infit') is not None for person in persons)
+        person_header = ["Shaxs", "EAP", "Standart Xato"] + (["Infit", "Outfit"] if person_fit else [])
+        person_data = [person_header]
         for person in display_persons:
-            person_data.append([
+            row = [
                 f"Shaxs {person.get('person_index', 'N/A')}",
                 f"{person.get('eap', 0):.3f}",
                 f"{person.get('se', 0):.3f}"
-            ])
+            ]
+            if person_fit:
+                row += [_fmt(person.get('infit'), 2), _fmt(person.get('outfit'), 2)]
+            person_data.append(row)
         
         if len(persons) > 10:
-            person_data.append([f"... va {len(persons) - 10} ta boshqa", "", ""])
+            person_data.append([f"... va {len(persons) - 10} ta boshqa"] + [""] * (len(person_header) - 1))
         
-        person_table = Table(person_data, colWidths=[1.2*inch, 1.2*inch, 1.2*inch])
+        person_table = Table(person_data, colWidths=[1.2*inch] * len(person_header))
         person_table.setStyle(TableStyle([
             ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
             ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
@@ -15,8 +15,11 @@ from telegram.ext import Application, CommandHandler, MessageHandler, filters, C
 import sys
 sys.path.append(str(Path(__file__).resolve().parents[1]))
 from app.core.r_runner import run_rasch_model  # type: ignore
-from app.core.cleaning import clean_response_matrix  # type: ignore
+from app.core.cleaning import apply_layout_indexed, prepare_rows  # type: ignore
+from app.core.layouts import apply_item_names, resolve_layout  # type: ignore
+from app.core.settings import settings  # type: ignore
 from app.services.pdf_generator import create_rasch_pdf_report  # type: ignore
+from app.services.calibrations import row_keys, run_incremental  # type: ignore
 
 
 def read_token() -> str:
@@ -52,7 +55,7 @@ async def help_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             "",
             "📈 PDF hisobotda quyidagilar bo'ladi:",
             "• Umumiy ma'lumotlar (AIC, BIC, Log-Likelihood)",
-            "• Item qiyinchilik parametrlari",
+            "• Item qiyinchilik parametrlari va fit statistikalari (infit/outfit, point-biserial)",
             "• Shaxs skorlari (EAP)",
             "• Vizual grafiklar"
         ])
@@ -69,6 +72,18 @@ def _write_cleaned_to_csv(cleaned: List[List[Optional[int]]]) -> Path:
     return tmp_path
 
 
+def _clean_for_chat(update: Update, matrix: List[List[Any]]):
+    # Har bir chat uchun jadval andozasi eslab qolinadi (header fingerprint bo'yicha)
+    rows = prepare_rows(matrix or [])
+    if not rows:
+        return [], None, [], None
+    chat = update.effective_chat
+    owner = f"tg:{chat.id}" if chat else None
+    layout, _ = resolve_layout(rows, owner=owner)
+    cleaned, kept = apply_layout_indexed(rows, layout)
+    return cleaned, layout, row_keys(rows, kept, layout, cleaned), owner
+
+
 async def handle_csv(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     doc: Document | None = update.message.document if update.message else None
     if not doc or not doc.file_name or not doc.file_name.lower().endswith(".csv"):
@@ -88,7 +103,7 @@ async def handle_csv(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             for line in f:
                 rows.append([c for c in line.rstrip("\n").split(",")])
 
-        cleaned = clean_response_matrix(rows)
+        cleaned, layout, keys, owner = _clean_for_chat(update, rows)
         if not cleaned:
             await update.message.reply_text("⚠️ Jadvalni tozalash imkonsiz: savollar aniqlanmadi.")
             tf_path.unlink(missing_ok=True)
@@ -100,7 +115,16 @@ async def handle_csv(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
         tmp_path = _write_cleaned_to_csv(cleaned)
         try:
-            result: dict[str, Any] = run_rasch_model(tmp_path)
+            def run_full() -> dict[str, Any]:
+                return run_rasch_model(tmp_path, timeout=settings.engine_timeout)
+
+            changelog: dict[str, Any] = {}
+            if owner and settings.bot_remember_calibrations:
+                # Shu chatdan avval yuborilgan jadval bo'lsa, faqat o'zgargan qatorlar qayta hisoblanadi
+                result, changelog = run_incremental(cleaned, keys, owner, layout.fingerprint, run_full)
+            else:
+                result = run_full()
+            result = apply_item_names(result, layout.item_names)
         finally:
             tmp_path.unlink(missing_ok=True)
     except Exception as e:
@@ -115,10 +139,15 @@ async def handle_csv(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         pdf_content = create_rasch_pdf_report(result)
         bio = io.BytesIO(pdf_content)
         bio.name = "rasch_report.pdf"
-        await update.message.reply_document(
-            document=bio,
-            caption=f"📊 Rasch Model Hisobot\n👥 {n_students} ta talabgor\n❓ {n_questions} ta savol"
-        )
+        caption = f"📊 Rasch Model Hisobot\n👥 {n_students} ta talabgor\n❓ {n_questions} ta savol"
+        if changelog.get("mode") in ("rescored", "unchanged"):
+            affected = changelog.get("affected_persons") or []
+            n_rows = sum(1 for p in affected if p.get("change") != "score_changed")
+            caption += (
+                f"\n♻️ Avvalgi hisob-kitob yangilandi: {n_rows} ta qator o'zgardi, "
+                f"{len(affected)} ta talabgor natijasi o'zgardi"
+            )
+        await update.message.reply_document(document=bio, caption=caption)
     except Exception as e:
         await update.message.reply_text(f"❌ PDF yaratishda xato: {e}")
 
@@ -135,7 +164,7 @@ async def calcjson(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
         payload = json.loads(payload_str)
         matrix = payload.get("responses")
-        cleaned = clean_response_matrix(matrix)
+        cleaned, layout, _, _ = _clean_for_chat(update, matrix)
         if not isinstance(cleaned, list) or not cleaned:
             raise ValueError("Kiritma tozalanmadi yoki bo'sh.")
     except Exception as e:
@@ -152,7 +181,8 @@ async def calcjson(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             for row in cleaned:
                 f.write(",".join("" if v is None else str(int(v)) for v in row) + "\n")
         try:
-            result = run_rasch_model(p)
+            result = run_rasch_model(p, timeout=settings.engine_timeout)
+            result = apply_item_names(result, layout.item_names)
         except Exception as e:
             await update.message.reply_text(f"❌ Hisoblash xatosi: {e}")
             return